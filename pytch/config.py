@@ -21,6 +21,16 @@ class PytchConfig:
         self.start_maximized = self.config["DEFAULT"].getboolean("start_maximized")
         self.accept = self.config["DEFAULT"].getboolean("accept")
 
+        # number of processes for pitch estimation. 0: estimate in the
+        # processing thread
+        self.pitch_processes = self.config["DEFAULT"].getint(
+            "pitch_processes", fallback=0
+        )
+
+        # keep complete sessions in files in this directory. Empty: keep only
+        # the last seconds in memory
+        self.session_dir = self.config["DEFAULT"].get("session_dir", fallback="")
+
         self.device_index = self.config["DEFAULT"].get("device_index")
         try:
             self.device_index = int(self.device_index)
@@ -42,6 +52,8 @@ def load_config():
             "start_maximized": False,
             "accept": False,
             "device_index": "None",
+            "pitch_processes": 0,
+            "session_dir": "",
         }
         with open(config_file_path, "w") as out:
             config.write(out)
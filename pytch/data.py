@@ -1,19 +1,26 @@
 import os
-import threading
+import json
+import time
 import atexit
+import weakref
+import queue
+import struct
+import threading
 import numpy as num
 import logging
 import pyaudio
 
 from collections import defaultdict
 from functools import lru_cache
+from scipy import sparse
 from scipy.io import wavfile
-from aubio import pitch
 from pytch.kalman import Kalman
 from pytch.util import f2cent, cent2f
 
-
-_lock = threading.Lock()
+try:
+    from aubio import pitch
+except ImportError:
+    pitch = None
 
 # This module contains buffering and input devices
 # class taken from the scipy 2015 vispy talk opening example
@@ -104,6 +111,7 @@ class Buffer:
         self.dtype = dtype
         self.empty()
         self.i_filled = 0
+        self.i_published = 0
         self._x = num.arange(self.data_len, dtype=self.dtype) * self.delta + self.tmin
         self.proxy = self._proxy if not proxy else proxy
 
@@ -181,6 +189,11 @@ class Buffer:
         self.data[self.i_filled + 1] = v
         self.i_filled += 1
 
+    def publish(self):
+        """Make the data appended so far visible to readers passing
+        `published=True`, e.g. views running in another thread."""
+        self.i_published = self.i_filled
+
     # def energy(self, nsamples_total, nsamples_sum=1):
     #    xi = num.arange(self.i_filled-nsamples_total, self.i_filled)
     #    y = self.data[xi].reshape((int(len(xi)/nsamples_sum), nsamples_sum))
@@ -188,51 +201,108 @@ class Buffer:
     #    return self._x[xi[::nsamples_sum]], y
 
 
+def write_mirrored(mirrored, i_filled, d):
+    """Write *d* along the first axis of the mirrored ring storage *mirrored*
+    which holds every sample twice (`mirrored[i] == mirrored[i + data_len]`).
+
+    :returns: new fill index. Assign it only after the call to publish the
+        written data."""
+    data_len = mirrored.shape[0] // 2
+    n = d.shape[0]
+    if n > data_len:
+        i_filled += n - data_len
+        d = d[-data_len:]
+        n = data_len
+
+    i = i_filled % data_len
+    mirrored[i : i + n] = d
+    iend = min(i + n, data_len)
+    mirrored[i + data_len : iend + data_len] = d[: iend - i]
+    if i + n > data_len:
+        mirrored[: i + n - data_len] = d[data_len - i :]
+
+    return i_filled + n
+
+
+def write_wrapped(data, i_filled, d):
+    """Write *d* along the first axis of the plain ring storage *data*.
+
+    :returns: new fill index"""
+    data_len = data.shape[0]
+    n = d.shape[0]
+    if n > data_len:
+        i_filled += n - data_len
+        d = d[-data_len:]
+        n = data_len
+
+    i = i_filled % data_len
+    iend = min(i + n, data_len)
+    data[i:iend] = d[: iend - i]
+    data[: i + n - iend] = d[iend - i :]
+    return i_filled + n
+
+
 class RingBuffer(Buffer):
-    """ Based on numpy"""
+    """Based on numpy
+
+    The data is stored twice in `_data_mirrored` so that any window of at
+    most `data_len` samples is a contiguous slice. `data` is a view on the
+    first half."""
 
     def __init__(self, *args, **kwargs):
         Buffer.__init__(self, *args, **kwargs)
 
+    def empty(self):
+        self._data_mirrored = num.zeros(2 * int(self.data_len), dtype=self.dtype)
+        self.data = self._data_mirrored[: self.data_len]
+
     def append(self, d):
         """append new data d to buffer f"""
-        n = d.size
-        if n == 1:
+        if d.ndim == 0:
             self.append_value(d)
             return
 
-        i_filled_mod = self.i_filled % self.data_len
-        istop = i_filled_mod + n
-        if istop >= self.data_len:
-            istop_wrap = istop - self.data_len
-            iwrap = n - istop_wrap
-            self.data[i_filled_mod:] = d[:iwrap]
-            self.data[0:istop_wrap] = d[iwrap:]
-        else:
-            self.data[i_filled_mod:istop] = d
-
-        self.i_filled += n
+        self.i_filled = write_mirrored(self._data_mirrored, self.i_filled, d)
 
     def append_value(self, v):
-        self.data[self.i_filled % self.data_len] = v
+        i_filled_mod = self.i_filled % self.data_len
+        self._data_mirrored[i_filled_mod] = v
+        self._data_mirrored[i_filled_mod + self.data_len] = v
         self.i_filled += 1
 
-    def latest_frame_data(self, n):
-        """ Return the latest n samples data from buffer as array."""
-        return self.proxy(
-            num.take(
-                self.data,
-                num.arange(self.i_filled - n, self.i_filled),
-                mode="wrap",
-                axis=0,
+    def frame_data(self, istart, istop):
+        """Return data between the absolute sample indices *istart* and
+        *istop* as array.
+
+        For windows of up to `data_len` samples this is a read-only view, no
+        data is copied."""
+        if istop - istart > self.data_len:
+            return self.proxy(
+                num.take(
+                    self.data,
+                    num.arange(istart, istop),
+                    mode="wrap",
+                    axis=0,
+                )
             )
-        )
 
-    def latest_frame(self, seconds, clip_min=False):
+        i = istart % self.data_len
+        frame = self._data_mirrored[i : i + istop - istart]
+        frame.flags.writeable = False
+        return self.proxy(frame)
+
+    def latest_frame_data(self, n, published=False):
+        """Return the latest n samples data from buffer as array.
+
+        :param published: read up to the last published sample"""
+        istop = self.i_published if published else self.i_filled
+        return self.frame_data(istop - n, istop)
+
+    def latest_frame(self, seconds, clip_min=False, published=False):
         """ Return the latest *seconds* data from buffer as x and y data tuple."""
-        istart, istop = self.latest_indices(seconds)
+        istop = self.i_published if published else self.i_filled
         n = int(seconds * self.sampling_rate) + 1
-        x = self.i_filled / self.sampling_rate - self._x[:n][::-1]
+        x = istop / self.sampling_rate - self._x[:n][::-1]
         if clip_min:
             istart = num.where(x > 0)[0]
             if not len(istart):
@@ -241,20 +311,22 @@ class RingBuffer(Buffer):
                 istart = num.min(istart)
         else:
             istart = 0
-        return (x[istart:], self.latest_frame_data(n - istart))
+        return (x[istart:], self.latest_frame_data(n - istart, published))
 
 
 class RingBuffer2D(RingBuffer):
-    """ 2 dimensional ring buffer. E.g. used to buffer spectrogram data."""
+    """2 dimensional ring buffer. E.g. used to buffer spectrogram data.
+
+    Unlike `RingBuffer` the rows are stored only once: its readers take few
+    or only new rows, so mirroring would double the largest buffers for
+    nothing. Windows wrapping around the end of the storage are copied."""
 
     def __init__(self, ndimension2, *args, **kwargs):
-        self.ndimension2 = ndimension2
+        self.ndimension2 = int(ndimension2)
         RingBuffer.__init__(self, *args, **kwargs)
 
     def empty(self):
-        self.data = num.ones(
-            (int(self.data_len), int(self.ndimension2)), dtype=self.dtype
-        )
+        self.data = num.ones((int(self.data_len), self.ndimension2), dtype=self.dtype)
 
     def append(self, d):
         if len(d.shape) == 1:
@@ -265,44 +337,942 @@ class RingBuffer2D(RingBuffer):
         if n2 != self.ndimension2:
             raise Exception("ndim2 wrong")
 
-        istop = self.i_filled + n
-        if istop >= self.data_len:
-            istop %= self.data_len
-            iwrap = n - istop
-            self.data[self.i_filled :] = d[:iwrap]
-            self.data[0:istop] = d[iwrap:]
-        else:
-            self.data[self.i_filled : istop] = d
-
-        self.i_filled = istop
+        self.i_filled = write_wrapped(self.data, self.i_filled, d)
 
     def append_value(self, v):
+        self.data[self.i_filled % self.data_len] = v
         self.i_filled += 1
-        self.i_filled %= self.data_len
-        self.data[self.i_filled, :] = v
 
+    def frame_data(self, istart, istop):
+        """Return rows between the absolute indices *istart* and *istop* as
+        array. Read-only view unless the window wraps around."""
+        i = istart % self.data_len
+        if istop - istart > self.data_len - i:
+            return self.proxy(
+                num.take(self.data, num.arange(istart, istop), mode="wrap", axis=0)
+            )
+
+        frame = self.data[i : i + istop - istart]
+        frame.flags.writeable = False
+        return self.proxy(frame)
+
+
+class MultiChannelRingBuffer2D(RingBuffer2D):
+    """2 dimensional ring buffer of several channels in one
+    `(nchannels, data_len, ndimension2)` array. All channels share a single
+    write index. E.g. used to buffer the spectrograms of all channels."""
+
+    def __init__(self, nchannels, ndimension2, *args, **kwargs):
+        self.nchannels = nchannels
+        RingBuffer2D.__init__(self, ndimension2, *args, **kwargs)
+
+    def empty(self):
+        self.data = num.ones(
+            (self.nchannels, int(self.data_len), self.ndimension2), dtype=self.dtype
+        )
+
+    def append(self, d):
+        """ Append `(nchannels, n, ndimension2)` array *d* to all channels."""
+        nchannels, n, n2 = d.shape
+        if nchannels != self.nchannels or n2 != self.ndimension2:
+            raise Exception("shape wrong")
+
+        self.i_filled = write_wrapped(
+            self.data.transpose(1, 0, 2), self.i_filled, d.transpose(1, 0, 2)
+        )
+
+    def frame_data(self, istart, istop):
+        """Return rows of all channels between the absolute indices *istart*
+        and *istop* as `(nchannels, n, ndimension2)` array. Read-only view
+        unless the window wraps around."""
+        i = istart % self.data_len
+        if istop - istart > self.data_len - i:
+            return self.proxy(
+                num.take(self.data, num.arange(istart, istop), mode="wrap", axis=1)
+            )
+
+        frame = self.data[:, i : i + istop - istart]
+        frame.flags.writeable = False
+        return self.proxy(frame)
+
+
+class RingBufferView(RingBuffer):
+    """Single channel view on a multi channel ring buffer sharing its write
+    index with the other channels, e.g. `MultiChannelRingBuffer` or
+    `MultiChannelRingBuffer2D`. Reading works through the usual `RingBuffer`
+    interface, appending only through the shared buffer."""
+
+    def __init__(self, buffer, ichannel, proxy=None):
+        self.buffer = buffer
+        self.ichannel = ichannel
+        self.sampling_rate = buffer.sampling_rate
+        self.tmin = buffer.tmin
+        self.tmax = buffer.tmax
+        self.dtype = buffer.dtype
+        self._x = buffer._x
+        self.proxy = self._proxy if not proxy else proxy
+
+    @property
+    def data(self):
+        return self.buffer.data[self.ichannel]
+
+    @property
+    def xdata(self):
+        return self.buffer.xdata
+
+    @property
+    def data_len(self):
+        return self.buffer.data_len
+
+    @property
+    def i_filled(self):
+        return self.buffer.i_filled
+
+    @property
+    def i_published(self):
+        return self.buffer.i_published
+
+    def frame_data(self, istart, istop):
+        return self.proxy(self.buffer.frame_data(istart, istop)[self.ichannel])
+
+    def append(self, d):
+        raise Exception("append to the shared buffer instead")
+
+    def append_value(self, v):
+        raise Exception("append to the shared buffer instead")
+
+    def publish(self):
+        self.buffer.publish()
+
+
+class MinMaxEnvelope(object):
+    """Level of detail summary of a multi channel buffer for drawing traces.
+
+    Level *k* holds the minimum and maximum of buckets of
+    `bucket_size * factor ** k` samples, so that a trace of any length can be
+    drawn from about as many buckets as there are pixels. Levels are ring
+    buffers of `(nbuckets, 2 * nchannels)`, minima first, updated
+    incrementally by `append`."""
+
+    def __init__(
+        self,
+        nchannels,
+        sampling_rate,
+        buffer_length_seconds,
+        bucket_size=8,
+        factor=4,
+        nlevels=6,
+        dtype=num.float32,
+    ):
+        self.nchannels = nchannels
+        self.sampling_rate = sampling_rate
+        self.factor = factor
+        self.bucket_sizes = [bucket_size * factor ** k for k in range(nlevels)]
+        self.levels = []
+        for size in self.bucket_sizes:
+            nbuckets = max(int(buffer_length_seconds * sampling_rate) // size, 1)
+            self.levels.append(
+                RingBuffer2D(
+                    ndimension2=2 * nchannels,
+                    sampling_rate=sampling_rate / size,
+                    buffer_length_seconds=(nbuckets + 0.5) * size / sampling_rate,
+                    dtype=dtype,
+                )
+            )
+
+        # samples and buckets not yet summarized in each level
+        self.pending = [num.zeros((0, nchannels), dtype=dtype)] + [
+            l.data[:0] for l in self.levels[:-1]
+        ]
+
+    def append(self, d):
+        """ Append `(nchannels, n)` array *d*."""
+        d = d.T
+        for ilevel, level in enumerate(self.levels):
+            if len(self.pending[ilevel]):
+                d = num.concatenate((self.pending[ilevel], d))
+
+            # level 0 summarizes samples, all further levels buckets
+            factor = self.bucket_sizes[0] if not ilevel else self.factor
+            n = len(d) // factor
+            self.pending[ilevel] = d[n * factor :].copy()
+            if not n:
+                break
+
+            d = d[: n * factor].reshape(n, factor, -1)
+            if not ilevel:
+                d = num.hstack((d.min(axis=1), d.max(axis=1)))
+            else:
+                nch = self.nchannels
+                d = num.hstack((d[:, :, :nch].min(axis=1), d[:, :, nch:].max(axis=1)))
+
+            level.append(d)
+
+    def select_level(self, nsamples, nbuckets):
+        """Index of the coarsest level providing at least *nbuckets* buckets
+        for *nsamples* samples."""
+        ilevel = 0
+        while (
+            ilevel < len(self.levels) - 1
+            and nsamples // self.bucket_sizes[ilevel + 1] >= nbuckets
+        ):
+            ilevel += 1
+        return ilevel
+
+    def publish(self):
+        for level in self.levels:
+            level.publish()
+
+    def latest(self, nsamples, nbuckets, published=False):
+        """Minima and maxima of the complete buckets within the latest
+        *nsamples* samples, from the coarsest level with at least *nbuckets*
+        buckets.
+
+        :param published: read up to the last published bucket
+        :returns: tuple of the index of the first sample of each bucket and
+            `(nchannels, n)` arrays of minima and maxima"""
+        ilevel = self.select_level(nsamples, nbuckets)
+        level = self.levels[ilevel]
+        size = self.bucket_sizes[ilevel]
+        istop = level.i_published if published else level.i_filled
+        istart = max(istop - nsamples // size, istop - level.data_len, 0)
+        d = level.frame_data(istart, istop).T
+        return (
+            num.arange(istart, istop) * size,
+            d[: self.nchannels],
+            d[self.nchannels :],
+        )
+
+
+def log_frequency_matrix(
+    freqs, standard_frequency, fmin=55.0, nbins=144, bins_per_semitone=2
+):
+    """Sparse matrix mapping power spectra at the linear frequencies *freqs*
+    to *nbins* logarithmically spaced bins.
+
+    Bin centers are aligned to *standard_frequency*, *bins_per_semitone* per
+    semitone, starting at the first center above *fmin*. Each bin averages
+    the FFT bins between the midpoints to its neighbours. Bins which are
+    narrower than the FFT resolution and contain no FFT bin are interpolated
+    linearly between the nearest FFT bins.
+
+    :returns: center frequencies and a `scipy.sparse.csr_matrix` of shape
+        (nbins, len(freqs))
+    """
+    step = 1.0 / (12 * bins_per_semitone)
+    kmin = num.ceil(num.log2(fmin / standard_frequency) / step)
+    centers = standard_frequency * 2 ** ((kmin + num.arange(nbins)) * step)
+    edges = standard_frequency * 2 ** ((kmin - 0.5 + num.arange(nbins + 1)) * step)
+
+    ibin = num.searchsorted(edges, freqs, side="right") - 1
+    (ifreq,) = num.where((ibin >= 0) & (ibin < nbins))
+    ibin = ibin[ifreq]
+    counts = num.bincount(ibin, minlength=nbins)
+
+    (iempty,) = num.where(counts == 0)
+    j = num.clip(num.searchsorted(freqs, centers[iempty]), 1, len(freqs) - 1)
+    w = num.clip((centers[iempty] - freqs[j - 1]) / (freqs[j] - freqs[j - 1]), 0.0, 1.0)
+
+    matrix = sparse.csr_matrix(
+        (
+            num.concatenate((1.0 / counts[ibin], 1.0 - w, w)),
+            (
+                num.concatenate((ibin, iempty, iempty)),
+                num.concatenate((ifreq, j - 1, j)),
+            ),
+        ),
+        shape=(nbins, len(freqs)),
+    )
+    return centers, matrix
+
+
+def max_resample(d, shape):
+    """Resample 2D array *d* to *shape* using the maximum of each group of
+    rows and columns. Rows and columns are repeated if *shape* is larger than
+    *d*."""
+    for axis, n in enumerate(shape):
+        indices = num.arange(n) * d.shape[axis] // n
+        d = num.maximum.reduceat(d, indices, axis=axis)
+    return d
+
+
+class SpectrogramPyramid(object):
+    """Time and frequency decimated levels of a spectrogram.
+
+    Level 0 is the full resolution spectrogram buffer *base*, which is
+    filled by the caller, e.g. a `RingBufferView` on the spectra of all
+    channels. Each further
+    level keeps the maximum of `time_factor` frames and `freq_factor` bins of
+    the level below, so it covers `time_factor` times more history in the
+    same number of frames. Levels are updated incrementally by `append`.
+
+    Coarser levels are only allocated once `latest_image` asked for them.
+    Their history starts with what the level below still holds at that
+    time."""
+
+    def __init__(
+        self,
+        base,
+        nlevels=4,
+        time_factor=8,
+        freq_factor=2,
+        level_length=None,
+        history_seconds=None,
+    ):
+        """
+        :param level_length: number of frames held by each coarser level,
+            by default as many as *base* holds
+        :param history_seconds: time covered at least by the coarsest level,
+            which is extended beyond *level_length* frames if needed"""
+        self.nlevels = nlevels
+        self.time_factor = time_factor
+        self.freq_factor = freq_factor
+        self.level_length = level_length or base.data_len
+        self.history_seconds = history_seconds
+        self.levels = [base]
+
+        # number of levels requested by `latest_image`
+        self.nrequested = 1
+
+        # index of the first frame held by each level
+        self.ifirst = [0]
+
+        # frames not yet pooled into the next level
+        self.pending = [base.data[:0]]
+
+    def add_level(self):
+        """Allocate the next coarser level and fill it from the level
+        below."""
+        below = self.levels[-1]
+        sampling_rate = below.sampling_rate / self.time_factor
+        nframes = self.level_length
+        if self.history_seconds and len(self.levels) == self.nlevels - 1:
+            nframes = max(nframes, int(self.history_seconds * sampling_rate) + 1)
+
+        level = RingBuffer2D(
+            ndimension2=-(-below.data.shape[1] // self.freq_factor),
+            sampling_rate=sampling_rate,
+            buffer_length_seconds=(nframes + 0.5) / sampling_rate,
+            dtype=below.dtype,
+        )
+
+        # pool the frames still available, aligned to a multiple of the
+        # time factor as if the level had existed from the start
+        istop = below.i_filled
+        istart = max(istop - below.data_len, self.ifirst[-1])
+        istart = -(-istart // self.time_factor) * self.time_factor
+        level.i_filled = istart // self.time_factor
+        self.ifirst.append(level.i_filled)
+        self.pending.append(below.frame_data(istart, max(istart, istop)).copy())
+
+        d = self.pool(len(self.levels), below.data[:0])
+        if len(d):
+            level.append(d)
+
+        self.levels.append(level)
+
+    def pool(self, ilevel, d):
+        """Pool frames *d* of level *ilevel - 1* into frames of level
+        *ilevel*. Frames not filling a complete group are kept pending."""
+        if len(self.pending[ilevel]):
+            d = num.concatenate((self.pending[ilevel], d))
+
+        n = len(d) // self.time_factor
+        self.pending[ilevel] = d[n * self.time_factor :].copy()
+        if not n:
+            return d[:0]
+
+        d = d[: n * self.time_factor]
+        d = d.reshape(n, self.time_factor, -1).max(axis=1)
+        return num.maximum.reduceat(
+            d, num.arange(0, d.shape[1], self.freq_factor), axis=1
+        )
+
+    def append(self, d):
+        """Pool full resolution frames *d* of shape (n, nbins), which have
+        just been appended to the base buffer, into the coarser levels."""
+        for ilevel in range(1, len(self.levels)):
+            d = self.pool(ilevel, d)
+            if not len(d):
+                break
+
+            self.levels[ilevel].append(d)
+
+        while len(self.levels) < min(self.nrequested, self.nlevels):
+            self.add_level()
+
+    def select_level(self, nframes, width):
+        """Index of the coarsest level providing at least *width* frames for
+        *nframes* full resolution frames."""
+        ilevel = 0
+        while (
+            ilevel < self.nlevels - 1
+            and nframes // self.time_factor ** (ilevel + 1) >= width
+        ):
+            ilevel += 1
+        return ilevel
+
+    def publish(self):
+        for level in self.levels:
+            level.publish()
+
+    def latest_image(self, nframes, nbins, shape, published=False):
+        """Spectrogram of the latest *nframes* frames and the lowest *nbins*
+        bins at full resolution, resampled to *shape* (ntimes, nbins).
+
+        Only the coarsest sufficient level is read, so the cost scales with
+        the size of the image rather than with *nframes*. Time not covered by
+        the buffers is zero.
+
+        Levels not allocated yet are requested from the next `append`. Until
+        then the finer levels are read.
+
+        :param published: read up to the last published frame"""
+        ilevel = self.select_level(nframes, shape[0])
+        self.nrequested = max(self.nrequested, ilevel + 1)
+        ilevel = min(ilevel, len(self.levels) - 1)
+        level = self.levels[ilevel]
+        n = -(-nframes // self.time_factor ** ilevel)
+        nb = -(-nbins // self.freq_factor ** ilevel)
+
+        i_filled = level.i_published if published else level.i_filled
+        navailable = min(n, i_filled - self.ifirst[ilevel], level.data_len)
+        image = num.zeros(shape, dtype=level.dtype)
+        nrows = shape[0] * navailable // n
+        if nrows:
+            d = level.latest_frame_data(navailable, published)[:, :nb]
+            image[shape[0] - nrows :] = max_resample(d, (nrows, shape[1]))
+
+        return image
+
+
+class SpectralAverage(object):
+    """Average of the latest spectra of a `RingBuffer2D`, updated by `append`
+    whenever spectra are appended to the buffer, so that reading it with
+    `mean` costs the same for any averaging length.
+
+    With *mode* ``"window"`` the exact sum of the latest *n* spectra is kept
+    as integers: spectra leaving the window are read back from the buffer and
+    subtracted. With ``"ema"`` an exponential moving average with a time
+    constant of *n* spectra is kept.
+
+    `set_length` and `append` have to be called from the thread filling the
+    buffer. Other threads read the average as of the last `publish`."""
+
+    def __init__(self, buffer, n=4, mode="window"):
+        self.buffer = buffer
+        self.set_length(n, mode)
+        self.publish()
+
+    def set_length(self, n, mode=None):
+        """Change the averaging length *n* (in spectra) and the *mode*. The
+        length is limited to the spectra held by the buffer."""
+        self.n = min(max(int(n), 1), self.buffer.data_len)
+        self.mode = mode or self.mode
+        latest = self.buffer.latest_frame_data(self.n)
+        if self.mode == "window":
+            self.state = latest.sum(axis=0, dtype=num.int64)
+        elif self.mode == "ema":
+            self.state = num.average(
+                latest, axis=0, weights=self.ema_weights(len(latest))
+            )
+        else:
+            raise Exception("Unknown averaging mode %s" % self.mode)
+
+    def ema_weights(self, k):
+        """ Weights of the latest *k* spectra in an update of the average."""
+        a = 1.0 - num.exp(-1.0 / self.n)
+        return a * (1.0 - a) ** num.arange(k - 1, -1, -1)
+
+    def append(self, d):
+        """Update with spectra *d* of shape (k, nbins) which have just been
+        appended to the buffer."""
+        k = len(d)
+        if self.mode == "ema":
+            self.state = (1.0 - self.ema_weights(1)[0]) ** k * self.state
+            self.state = self.state + self.ema_weights(k).dot(d)
+            return
+
+        i = self.buffer.i_filled
+        if k >= self.n or self.n + k > self.buffer.data_len:
+            self.state = self.buffer.latest_frame_data(self.n).sum(
+                axis=0, dtype=num.int64
+            )
+            return
+
+        removed = self.buffer.frame_data(i - self.n - k, i - self.n)
+        self.state = (
+            self.state
+            + d.sum(axis=0, dtype=num.int64)
+            - removed.sum(axis=0, dtype=num.int64)
+        )
+
+    def publish(self):
+        self.published_mean = self.mean()
+
+    def mean(self, published=False):
+        """Averaged spectrum.
+
+        :param published: the average as of the last `publish`"""
+        if published:
+            return self.published_mean
+
+        if self.mode == "ema":
+            return self.state
+
+        return self.state / self.n
+
+
+class MultiChannelRingBuffer(RingBuffer):
+    """Ring buffer holding several channels in one `(nchannels, data_len)`
+    array. All channels share a single write index."""
+
+    def __init__(self, nchannels, *args, envelope=True, **kwargs):
+        """
+        :param envelope: keep a `MinMaxEnvelope` of the samples for drawing
+            traces"""
+        self.nchannels = nchannels
+        RingBuffer.__init__(self, *args, **kwargs)
+        self.envelope = None
+        if envelope:
+            self.envelope = MinMaxEnvelope(
+                nchannels,
+                self.sampling_rate,
+                self.data_len / self.sampling_rate,
+                dtype=self.dtype,
+            )
+
+    def empty(self):
+        self._data_mirrored = num.zeros(
+            (self.nchannels, 2 * int(self.data_len)), dtype=self.dtype
+        )
+        self.data = self._data_mirrored[:, : self.data_len]
+
+    def append(self, d):
+        """ Append `(nchannels, n)` array *d* to all channels at once."""
+        nchannels, n = d.shape
+        if nchannels != self.nchannels:
+            raise Exception("number of channels wrong")
+
+        self.i_filled = write_mirrored(self._data_mirrored.T, self.i_filled, d.T)
+        if self.envelope is not None:
+            self.envelope.append(d)
+
+    def frame_data(self, istart, istop):
+        """Return data of all channels between the absolute sample indices
+        *istart* and *istop* as `(nchannels, n)` array. For windows of up to
+        `data_len` samples this is a read-only view."""
+        if istop - istart > self.data_len:
+            return self.proxy(
+                num.take(
+                    self.data,
+                    num.arange(istart, istop),
+                    mode="wrap",
+                    axis=1,
+                )
+            )
+
+        i = istart % self.data_len
+        frame = self._data_mirrored[:, i : i + istop - istart]
+        frame.flags.writeable = False
+        return self.proxy(frame)
+
+
+class MemmapBuffer(Buffer):
+    """Disk backed multi channel buffer keeping all samples since start.
+
+    Samples are stored interleaved as `(n, nchannels)` in a `numpy.memmap` of
+    file *fn* which grows in preallocated segments. Written pages are left to
+    the page cache, so resident memory stays bounded while recent data is
+    read from memory. Can replace the `MultiChannelRingBuffer` of `Channel`
+    instances to record sessions of arbitrary length.
+
+    The sampling rate, channels and sample type are written to the JSON file
+    `fn + ".json"` next to the samples, see `read_session`."""
+
+    def __init__(
+        self,
+        fn,
+        nchannels,
+        sampling_rate,
+        segment_length_seconds=60.0,
+        envelope_length_seconds=60.0,
+        dtype=num.float32,
+        channels=None,
+    ):
+        """
+        :param envelope_length_seconds: length of the most recent part of
+            the session summarized by `envelope`
+        :param channels: indices of the recorded input channels, by default
+            `0 ... nchannels - 1`"""
+        self.fn = fn
+        self.nchannels = nchannels
+        self.segment_size = int(segment_length_seconds * sampling_rate)
+        self.capacity = 0
+        with open(session_header_fn(fn), "w") as f:
+            json.dump(
+                dict(
+                    sampling_rate=sampling_rate,
+                    nchannels=nchannels,
+                    dtype=num.dtype(dtype).str,
+                    channels=[int(i) for i in channels or range(nchannels)],
+                ),
+                f,
+            )
+
+        self._file = open(fn, "w+b")
+        Buffer.__init__(self, sampling_rate, segment_length_seconds, dtype=dtype)
+        self.envelope = MinMaxEnvelope(
+            nchannels, sampling_rate, envelope_length_seconds, dtype=dtype
+        )
+        atexit.register(self.close)
+
+    def empty(self):
+        self.i_filled = 0
+        self.grow(self.segment_size)
+
+    def grow(self, n):
+        """Extend the file to hold at least *n* samples per channel."""
+        nsegments = -(-n // self.segment_size)
+        capacity = max(nsegments, 1) * self.segment_size
+        if capacity <= self.capacity:
+            return
+
+        rowsize = self.nchannels * num.dtype(self.dtype).itemsize
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(
+                self._file.fileno(),
+                self.capacity * rowsize,
+                (capacity - self.capacity) * rowsize,
+            )
+        else:
+            self._file.truncate(capacity * rowsize)
+
+        # previously returned views keep the old mapping alive
+        self._mm = num.memmap(
+            self._file, dtype=self.dtype, mode="r+", shape=(capacity, self.nchannels)
+        )
+        self.capacity = capacity
+        logger.debug("grew %s to %i samples" % (self.fn, capacity))
+
+    @property
+    def data_len(self):
+        """ Samples are never overwritten."""
+        return self.capacity
+
+    @data_len.setter
+    def data_len(self, n):
+        pass
+
+    @property
+    def data(self):
+        return self._mm[: self.i_filled].T
+
+    @property
+    def xdata(self):
+        """Sample times, computed on demand as the recording grows."""
+        return num.arange(self.i_filled) * self.delta + self.tmin
+
+    def append(self, d):
+        """ Append `(nchannels, n)` array *d* to all channels at once."""
+        nchannels, n = d.shape
+        if nchannels != self.nchannels:
+            raise Exception("number of channels wrong")
+
+        self.grow(self.i_filled + n)
+        self._mm[self.i_filled : self.i_filled + n] = d.T
+        self.i_filled += n
+        self.envelope.append(d)
+
+    def frame_data(self, istart, istop):
+        """Return data of all channels between the sample indices *istart*
+        and *istop* as `(nchannels, n)` array. Samples before the start of
+        the recording are zeros."""
+        if istart < 0:
+            frame = num.zeros((self.nchannels, istop - istart), dtype=self.dtype)
+            if istop > 0:
+                frame[:, -istart:] = self._mm[:istop].T
+            return self.proxy(frame)
+
+        frame = self._mm[istart:istop].T
+        frame.flags.writeable = False
+        return self.proxy(frame)
+
+    def latest_frame_data(self, n, published=False):
+        istop = self.i_published if published else self.i_filled
+        return self.frame_data(istop - n, istop)
+
+    def close(self):
+        """Flush to disk and cut the file to the recorded length."""
+        atexit.unregister(self.close)
+        if self._file.closed:
+            return
+
+        self._mm.flush()
+        del self._mm
+        rowsize = self.nchannels * num.dtype(self.dtype).itemsize
+        self._file.truncate(self.i_filled * rowsize)
+        self._file.close()
+
+
+def session_header_fn(fn):
+    """ File name of the JSON header of the session recorded to *fn*."""
+    return fn + ".json"
+
+
+def read_session(fn):
+    """Open a session recorded by a `MemmapBuffer` to *fn*.
+
+    :returns: tuple of the header dictionary with `sampling_rate`,
+        `nchannels`, `dtype` and `channels` and a read-only memmap of shape
+        `(n, nchannels)`. Sessions which have not been closed properly end
+        with the zeros of the last preallocated segment."""
+    with open(session_header_fn(fn)) as f:
+        header = json.load(f)
+
+    rowsize = header["nchannels"] * num.dtype(header["dtype"]).itemsize
+    n = os.path.getsize(fn) // rowsize
+    if not n:
+        data = num.zeros((0, header["nchannels"]), dtype=header["dtype"])
+    else:
+        data = num.memmap(
+            fn, dtype=header["dtype"], mode="r", shape=(n, header["nchannels"])
+        )
+
+    return header, data
+
+
+# pitch algorithm implemented by `pytch.processing.yin`, not requiring aubio
+NUMPY_YIN = "yin-numpy"
+
+
+def get_pitch_algorithms():
+    """ List of available pitch algorithms."""
+    algorithms = []
+    if pitch is not None:
+        algorithms.extend(
+            [
+                "default",
+                "schmitt",
+                "fcomb",
+                "mcomb",
+                "specacf",
+                "yin",
+                "yinfft",
+                "yinfast",
+            ]
+        )
+
+    algorithms.append(NUMPY_YIN)
+    return algorithms
 
-class Channel(RingBuffer):
-    def __init__(self, sampling_rate, fftsize=8192):
 
-        self.buffer_length_seconds = 40
-        RingBuffer.__init__(self, sampling_rate, self.buffer_length_seconds)
+def get_default_pitch_algorithm():
+    return "yinfast" if pitch is not None else NUMPY_YIN
 
-        self.__algorithm = "yinfast"
+
+def make_pitch_detector(algorithm, fftsize, hop_size, sampling_rate, tolerance=0.8):
+    """aubio pitch detector returning frequencies in Hz. Returns None for
+    `NUMPY_YIN` which is evaluated by the `pytch.processing.Worker`."""
+    if algorithm == NUMPY_YIN:
+        return None
+
+    pitch_o = pitch(algorithm, fftsize, hop_size, int(sampling_rate))
+    pitch_o.set_unit("Hz")
+    pitch_o.set_tolerance(tolerance)
+    return pitch_o
+
+
+class ChannelAnalysis(object):
+    """Spectra and pitch estimates of the channels of a sample buffer which
+    share FFT and hop size, computed once per hop by
+    `pytch.processing.Worker`.
+
+    Results of all channels are stored in `(nchannels, ...)` ring buffers
+    sharing a single write index, channels read their rows through
+    `RingBufferView` instances. Use `shared` to get the instance of a
+    buffer."""
+
+    # instances by sample buffer and (fftsize, hop_size)
+    _shared = weakref.WeakKeyDictionary()
+
+    def __init__(
+        self, buffer, fftsize, hop_size, nspectra, log_nbins, buffer_length_seconds
+    ):
+        """
+        :param buffer: `MultiChannelRingBuffer` or `MemmapBuffer` holding the
+            samples
+        :param nspectra: number of full resolution spectra kept
+        :param buffer_length_seconds: history of the pitch estimates"""
+        nchannels = buffer.nchannels
+        sr = buffer.sampling_rate / hop_size
+        self.fft = MultiChannelRingBuffer2D(
+            nchannels,
+            fftsize // 2 + 1,
+            sampling_rate=sr,
+            buffer_length_seconds=(nspectra + 0.5) / sr,
+            dtype=num.uint32,
+        )
+        self.log_fft = MultiChannelRingBuffer2D(
+            nchannels,
+            log_nbins,
+            sampling_rate=sr,
+            buffer_length_seconds=(nspectra + 0.5) / sr,
+            dtype=num.float32,
+        )
+        self.fft_power = MultiChannelRingBuffer(
+            nchannels, sr, buffer_length_seconds, envelope=False
+        )
+        self.pitch = MultiChannelRingBuffer(
+            nchannels, sr, buffer_length_seconds, envelope=False
+        )
+        self.pitch_confidence = MultiChannelRingBuffer(
+            nchannels, sr, buffer_length_seconds, envelope=False
+        )
+
+        # sample index of the last sample of each processed frame
+        self.frame_index = RingBuffer(
+            sampling_rate=sr,
+            buffer_length_seconds=buffer_length_seconds,
+            dtype=num.int64,
+        )
+        # sample index up to which hops have been processed
+        self.i_processed = buffer.i_filled
+
+    @classmethod
+    def shared(cls, buffer, fftsize, hop_size, *args):
+        """Instance shared by all channels of *buffer* with *fftsize* and
+        *hop_size*. Further arguments are passed to `__init__` if a new
+        instance is created."""
+        analyses = cls._shared.setdefault(buffer, weakref.WeakValueDictionary())
+        analysis = analyses.get((fftsize, hop_size))
+        if analysis is None:
+            analysis = cls(buffer, fftsize, hop_size, *args)
+            analyses[fftsize, hop_size] = analysis
+
+        return analysis
+
+    @property
+    def buffers(self):
+        return (
+            self.fft,
+            self.log_fft,
+            self.fft_power,
+            self.pitch,
+            self.pitch_confidence,
+            self.frame_index,
+        )
+
+    def append(self, rows, spectra, log_spectra, pitch, confidence, frame_index):
+        """Append the results of the same hops of the channels *rows*, given
+        as arrays of shape `(len(rows), nhops, ...)`. Rows of other channels
+        are zero."""
+
+        def expand(d):
+            if list(rows) == list(range(self.fft.nchannels)):
+                return d
+
+            full = num.zeros((self.fft.nchannels,) + d.shape[1:], dtype=d.dtype)
+            full[rows] = d
+            return full
+
+        self.fft.append(expand(spectra))
+        self.log_fft.append(expand(log_spectra))
+        self.fft_power.append(expand(spectra.sum(axis=2, dtype=num.float32)))
+        self.pitch.append(expand(pitch))
+        self.pitch_confidence.append(expand(confidence))
+        self.frame_index.append(frame_index)
+
+    def publish(self):
+        for buffer in self.buffers:
+            buffer.publish()
+
+
+class Channel(RingBufferView):
+    """Single channel view on a `MultiChannelRingBuffer` or `MemmapBuffer`.
+
+    Reading works through the usual `RingBuffer` interface. Channels sharing
+    a buffer have to be filled through the buffer's `append` method. Their
+    spectra and pitches are views on a `ChannelAnalysis` shared with the
+    other channels of the buffer."""
+
+    buffer_length_seconds = 40
+
+    # The full resolution spectra are kept for the longest spectral average
+    # offered by the GUI, but at least for drawing the latest spectrogram.
+    # Longer histories are read from the spectrogram pyramids, whose coarser
+    # levels hold enough frames for images of up to 128 frames, see
+    # `SpectrogramPyramid.select_level`, and the longest history offered.
+    spectrum_buffer_length_seconds = 6.0
+    spectrum_buffer_min_frames = 256
+    spectrogram_level_length = 1024
+    spectrogram_history_seconds = 3 * 3600.0
+
+    # semitone spectrogram bins, see `log_frequency_matrix`
+    log_fmin = 55.0
+    log_nbins = 144
+    log_bins_per_semitone = 2
+
+    def __init__(
+        self, sampling_rate, fftsize=8192, hop_size=1024, buffer=None, ichannel=0
+    ):
+        """
+        :param hop_size: number of samples between two consecutive spectra
+            and pitch estimates
+        :param buffer: `MultiChannelRingBuffer` or `MemmapBuffer` holding the
+            samples. If not given, a ring buffer holding only this channel is
+            created.
+        :param ichannel: index of this channel in *buffer*
+        """
+        if buffer is None:
+            buffer = MultiChannelRingBuffer(
+                1, sampling_rate, self.buffer_length_seconds
+            )
+
+        RingBufferView.__init__(self, buffer, ichannel)
+
+        self.__algorithm = get_default_pitch_algorithm()
         self.name = ""
         self.pitch_o = None
+        self.__hop_size = hop_size
+        self.__standard_frequency = 220.0
+        self.spectrum_average_length = 4
+        self.spectrum_average_mode = "window"
         self.fftsize = fftsize
-        self.setup_pitch()
-        self.setup_buffers()
 
         # TODO refactor to processing module
         P = 0.0
         R = 0.01 ** 2
         Q = 1e-6
         self.kalman_pitch_filter = Kalman(P, R, Q)
-        self.standard_frequency = 220.0
         self.pitch_shift = 0.0
 
+    @property
+    def i_processed(self):
+        """ Sample index up to which hops have been processed."""
+        return self.analysis.i_processed
+
+    @i_processed.setter
+    def i_processed(self, i):
+        self.analysis.i_processed = i
+
+    def latest_envelope(self, seconds, nbuckets, published=False):
+        """Return the envelope of the latest *seconds* as x and y data tuple
+        for drawing traces *nbuckets* pixels wide. Minimum and maximum of each
+        bucket alternate."""
+        istart, mins, maxs = self.buffer.envelope.latest(
+            int(seconds * self.sampling_rate), nbuckets, published
+        )
+        y = num.empty(2 * len(istart), dtype=mins.dtype)
+        y[::2] = mins[self.ichannel]
+        y[1::2] = maxs[self.ichannel]
+        return num.repeat(istart * self.delta + self.tmin, 2), self.proxy(y)
+
+    def append(self, d):
+        """Append samples *d*. Only possible if the channel does not share
+        its buffer with other channels."""
+        self.buffer.append(d.reshape(1, -1))
+
     def pitch_proxy(self, data):
         # TODO refactor to processing module
         return f2cent(data, self.standard_frequency) + self.pitch_shift
@@ -312,44 +1282,99 @@ class Channel(RingBuffer):
         return cent2f(data - self.pitch_shift, self.standard_frequency)
 
     def setup_buffers(self):
-        """Setup Buffers."""
+        """Setup Buffers.
+
+        Spectra and pitches are computed once per hop, so all of these
+        buffers are sampled at `sampling_rate / hop_size`. They are views on
+        the `ChannelAnalysis` shared with the other channels of the buffer
+        which use the same FFT and hop size. The spectrum
+        buffers are sized by frames rather than by `buffer_length_seconds`,
+        so that small hop sizes do not multiply their size."""
         nfft = (int(self.fftsize), self.delta)
         self.freqs = num.fft.rfftfreq(*nfft)
-        sr = int(1000.0 / 58.0)
-        # TODO: 58=gui refresh rate. Nastily hard coded here for now
-        self.fft = RingBuffer2D(
-            ndimension2=self.fftsize / 2 + 1,
-            # sampling_rate=self.sampling_rate/self.fftsize,   # Hop size
-            sampling_rate=sr,
-            buffer_length_seconds=self.buffer_length_seconds,
-            dtype=num.uint32,
+        sr = self.sampling_rate / self.hop_size
+        self.analysis = ChannelAnalysis.shared(
+            self.buffer,
+            int(self.fftsize),
+            self.hop_size,
+            max(
+                int(self.spectrum_buffer_length_seconds * sr),
+                self.spectrum_buffer_min_frames,
+            ),
+            self.log_nbins,
+            self.buffer_length_seconds,
         )
-        self.fft_power = RingBuffer(
-            sampling_rate=sr, buffer_length_seconds=self.buffer_length_seconds
+        self.fft = RingBufferView(self.analysis.fft, self.ichannel)
+        self.fft_pyramid = SpectrogramPyramid(
+            self.fft,
+            level_length=self.spectrogram_level_length,
+            history_seconds=self.spectrogram_history_seconds,
         )
-        self.pitch = RingBuffer(
-            sampling_rate=sr,
-            buffer_length_seconds=self.sampling_rate
-            * self.buffer_length_seconds
-            / self.fftsize,
-            proxy=self.pitch_proxy,
+        self.setup_log_frequency()
+        self.log_fft = RingBufferView(self.analysis.log_fft, self.ichannel)
+        self.log_fft_pyramid = SpectrogramPyramid(
+            self.log_fft,
+            freq_factor=1,
+            level_length=self.spectrogram_level_length,
+            history_seconds=self.spectrogram_history_seconds,
         )
-        self.pitch_confidence = RingBuffer(
-            sampling_rate=sr,
-            buffer_length_seconds=self.sampling_rate
-            * self.buffer_length_seconds
-            / self.fftsize,
+        self.fft_average = SpectralAverage(
+            self.fft, self.spectrum_average_length, self.spectrum_average_mode
         )
+        self.fft_power = RingBufferView(self.analysis.fft_power, self.ichannel)
+        self.pitch = RingBufferView(
+            self.analysis.pitch, self.ichannel, proxy=self.pitch_proxy
+        )
+        self.pitch_confidence = RingBufferView(
+            self.analysis.pitch_confidence, self.ichannel
+        )
+        self.frame_index = self.analysis.frame_index
+
+    def publish(self):
+        """Publish the samples and analysis results appended so far to
+        readers passing `published=True`. Called by the processing thread
+        once all buffers of the channel are updated."""
+        self.buffer.publish()
+        self.buffer.envelope.publish()
+        self.analysis.publish()
+        self.fft_pyramid.publish()
+        self.log_fft_pyramid.publish()
+        self.fft_average.publish()
+
+    def set_spectrum_average(self, n, mode="window"):
+        """Average the latest *n* spectra in `fft_average`, see
+        `SpectralAverage`. Call it from the processing thread while a
+        `pytch.processing.Worker` is running."""
+        self.spectrum_average_length = n
+        self.spectrum_average_mode = mode
+        self.fft_average.set_length(n, mode)
+
+    def setup_log_frequency(self):
+        """ Map the FFT bins to semitone bins relative to `standard_frequency`."""
+        self.log_freqs, self.log_fft_matrix = log_frequency_matrix(
+            self.freqs,
+            self.standard_frequency,
+            fmin=self.log_fmin,
+            nbins=self.log_nbins,
+            bins_per_semitone=self.log_bins_per_semitone,
+        )
+
+    def to_log_frequency(self, spectra):
+        """ Map power spectra of shape (n, nfft) to the semitone bins."""
+        return num.asarray(self.log_fft_matrix.dot(spectra.T).T, dtype=num.float32)
+
+    @property
+    def standard_frequency(self):
+        return self.__standard_frequency
 
-    def latest_confident_indices(self, n, threshold):
-        return num.where(self.pitch_confidence.latest_frame_data(n) >= threshold)
+    @standard_frequency.setter
+    def standard_frequency(self, f):
+        self.__standard_frequency = f
+        self.setup_log_frequency()
 
-    def append_value_pitch(self, val, apply_kalman=False):
-        """Append a new pitch value to pitch buffer. Apply Kalman filter
-        before appending"""
-        if apply_kalman:
-            val = self.kalman_pitch_filter.evaluate(val)
-        self.pitch.append_value(val)
+    def latest_confident_indices(self, n, threshold, published=False):
+        confidence = self.pitch_confidence.latest_frame_data(n, published)
+        return num.where(confidence >= threshold)
 
     @property
     def fftsize(self):
@@ -359,6 +1384,17 @@ class Channel(RingBuffer):
     def fftsize(self, size):
         self.__fftsize = size
         self.setup_buffers()
+        self.setup_pitch()
+
+    @property
+    def hop_size(self):
+        return min(self.__hop_size, self.fftsize)
+
+    @hop_size.setter
+    def hop_size(self, size):
+        self.__hop_size = size
+        self.setup_buffers()
+        self.setup_pitch()
 
     @property
     def pitch_algorithm(self):
@@ -370,28 +1406,207 @@ class Channel(RingBuffer):
         self.setup_buffers()
         self.setup_pitch()
 
-    def get_latest_pitch(self):
-        return self.pitch.latest_frame_data(1)
+    def get_latest_pitch(self, published=False):
+        return self.pitch.latest_frame_data(1, published)
 
     def setup_pitch(self):
         if self.pitch_o:
             self.pitch_o = None
-        tolerance = 0.8
-        win_s = self.fftsize
 
         # TODO check parameters
-        self.pitch_o = pitch(self.pitch_algorithm, win_s, win_s, self.sampling_rate)
-        self.pitch_o.set_unit("Hz")
-        self.pitch_o.set_tolerance(tolerance)
+        self.pitch_o = make_pitch_detector(*self.pitch_parameters)
+
+    @property
+    def pitch_parameters(self):
+        """ Arguments to `make_pitch_detector` reproducing this channel's
+        pitch detector."""
+        return (self.pitch_algorithm, self.fftsize, self.hop_size, self.sampling_rate)
+
+
+class AudioRingBuffer:
+    """Lock-free single-producer/single-consumer ring of interleaved frames.
+
+    The producer (e.g. the PortAudio callback) only ever advances `i_write`,
+    the consumer only advances `i_read`. Both indices grow monotonically and
+    are published by a single assignment after the data has been copied, so
+    neither side needs a lock. If the consumer falls behind by more than the
+    capacity, incoming chunks are dropped and counted in `noverflow`, which
+    is likewise only written by the producer and never reset."""
+
+    def __init__(self, nframes, nchannels, dtype=num.int16):
+        self.nframes = int(nframes)
+        self.nchannels = nchannels
+        self.data = num.zeros((self.nframes, nchannels), dtype=dtype)
+        self.i_write = 0
+        self.i_read = 0
+        self.noverflow = 0
+
+    @property
+    def nfilled(self):
+        """ Number of frames written but not yet read."""
+        return self.i_write - self.i_read
+
+    def write(self, d):
+        """Copy `(n, nchannels)` array *d* into the ring. Bounded O(n) work,
+        never blocks. Returns False if *d* did not fit and was dropped."""
+        n = d.shape[0]
+        if n > self.nframes - (self.i_write - self.i_read):
+            self.noverflow += 1
+            return False
+
+        i = self.i_write % self.nframes
+        nfirst = min(n, self.nframes - i)
+        self.data[i : i + nfirst] = d[:nfirst]
+        self.data[: n - nfirst] = d[nfirst:]
+        self.i_write += n
+        return True
+
+    def read(self):
+        """ Return all pending frames as `(n, nchannels)` array and release them."""
+        i_write = self.i_write
+        n = i_write - self.i_read
+        i = self.i_read % self.nframes
+        nfirst = min(n, self.nframes - i)
+        frames = num.empty((n, self.nchannels), dtype=self.data.dtype)
+        frames[:nfirst] = self.data[i : i + nfirst]
+        frames[nfirst:] = self.data[: n - nfirst]
+        self.i_read = i_write
+        return frames
+
+
+class WavWriter(object):
+    """Streams interleaved 16 bit audio chunks to a WAV file.
+
+    `write` only puts the chunk into a queue and can be called from the
+    audio callback. Writing happens on a separate thread which also updates
+    the header every *header_interval* seconds of audio, so the file is
+    valid while recording. Switches to RF64 if the data exceeds 4 GB."""
+
+    header_size = 80
+
+    def __init__(
+        self,
+        fn,
+        nchannels,
+        sampling_rate,
+        selected_channels=None,
+        header_interval=1.0,
+    ):
+        """
+        :param nchannels: number of channels of the chunks passed to `write`
+        :param selected_channels: indices of channels to write. Default: all
+        """
+        self.fn = fn
+        self.nchannels = nchannels
+        self.sampling_rate = int(sampling_rate)
+        self.selected_channels = selected_channels
+        if selected_channels is None or list(selected_channels) == list(
+            range(nchannels)
+        ):
+            self.selected_channels = None
+
+        self.nchannels_out = (
+            nchannels if self.selected_channels is None else len(selected_channels)
+        )
+        self.block_align = 2 * self.nchannels_out
+        self.header_interval_bytes = int(
+            header_interval * self.sampling_rate * self.block_align
+        )
+        self.nbytes = 0
+
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        """Queue a chunk of interleaved int16 samples (bytes or array)."""
+        self.queue.put(data)
+
+    def close(self, wait=True):
+        """Write all queued chunks and finalize the header.
+
+        :param wait: block until everything is written"""
+        self.queue.put(None)
+        if wait:
+            self.thread.join()
+
+    def write_header(self, f):
+        riff_size = self.header_size - 8 + self.nbytes
+        f.seek(0)
+        if riff_size > 0xFFFFFFFF:
+            f.write(b"RF64" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE")
+            f.write(
+                b"ds64"
+                + struct.pack(
+                    "<IQQQI",
+                    28,
+                    riff_size,
+                    self.nbytes,
+                    self.nbytes // self.block_align,
+                    0,
+                )
+            )
+            data_size = 0xFFFFFFFF
+        else:
+            # the JUNK chunk reserves space for a ds64 chunk
+            f.write(b"RIFF" + struct.pack("<I", riff_size) + b"WAVE")
+            f.write(b"JUNK" + struct.pack("<I", 28) + bytes(28))
+            data_size = self.nbytes
+
+        f.write(
+            b"fmt "
+            + struct.pack(
+                "<IHHIIHH",
+                16,
+                1,
+                self.nchannels_out,
+                self.sampling_rate,
+                self.sampling_rate * self.block_align,
+                self.block_align,
+                16,
+            )
+        )
+        f.write(b"data" + struct.pack("<I", data_size))
+        f.seek(0, os.SEEK_END)
+
+    def run(self):
+        with open(self.fn, "wb") as f:
+            self.write_header(f)
+            nbytes_header = 0
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+
+                if isinstance(data, bytes):
+                    data = num.frombuffer(data, dtype=num.int16)
+
+                if self.selected_channels is not None:
+                    data = data.reshape(-1, self.nchannels)[:, self.selected_channels]
+
+                data = num.ascontiguousarray(data, dtype="<i2")
+                f.write(data)
+                self.nbytes += data.nbytes
+
+                if self.nbytes - nbytes_header >= self.header_interval_bytes:
+                    self.write_header(f)
+                    nbytes_header = self.nbytes
+
+            self.write_header(f)
+
+        logger.info("wrote %s" % self.fn)
 
 
 class DataProvider(object):
     """ Base class defining common interface for data input to Worker"""
 
     def __init__(self):
-        self.frames = []
         atexit.register(self.terminate)
 
+    def flush(self):
+        """Move newly arrived data into the channels. Called by the Worker."""
+        pass
+
     def terminate(self):
         # cleanup
         pass
@@ -406,12 +1621,22 @@ class MicrophoneRecorder(DataProvider):
         device_no=None,
         sampling_rate=None,
         fftsize=1024,
+        hop_size=1024,
         selected_channels=None,
+        session_fn=None,
     ):
+        """
+        :param session_fn: if given, keep all samples of the session in a
+            `MemmapBuffer` backed by this file instead of the last
+            `Channel.buffer_length_seconds` in memory"""
 
+        # used by `terminate`, which is registered at exit by DataProvider
+        self.stream = None
+        self.paudio = None
+        self.wav_writer = None
+        self.buffer = None
         DataProvider.__init__(self)
 
-        self.stream = None
         self.paudio = pyaudio.PyAudio()
         self.nchannels = max(selected_channels) + 1
 
@@ -419,13 +1644,37 @@ class MicrophoneRecorder(DataProvider):
         self.sampling_rate = sampling_rate
         self.selected_channels = selected_channels
 
-        self.channels = []
-        for i in range(self.nchannels):
-            self.channels.append(Channel(self.sampling_rate, fftsize=fftsize))
+        if session_fn:
+            self.buffer = MemmapBuffer(
+                session_fn,
+                len(self.selected_channels),
+                self.sampling_rate,
+                channels=self.selected_channels,
+            )
+        else:
+            self.buffer = MultiChannelRingBuffer(
+                len(self.selected_channels),
+                self.sampling_rate,
+                Channel.buffer_length_seconds,
+            )
 
-        self.channels = [self.channels[i] for i in self.selected_channels]
+        self.channels = [
+            Channel(
+                self.sampling_rate,
+                fftsize=fftsize,
+                hop_size=hop_size,
+                buffer=self.buffer,
+                ichannel=i,
+            )
+            for i in range(len(self.selected_channels))
+        ]
 
         self.chunksize = chunksize
+        # leaves the consumer about 64 chunks of slack before audio is dropped
+        self.audio_ring = AudioRingBuffer(self.chunksize * 64, self.nchannels)
+        # overflows of `audio_ring` already reported by `flush`
+        self.noverflow_reported = 0
+        self._stop = True
 
     @property
     def fftsizes(self):
@@ -440,28 +1689,31 @@ class MicrophoneRecorder(DataProvider):
 
     def new_frame(self, data, frame_count, time_info, status):
         """Callback function called as soon as pyaudio anounces new
-        available data."""
-        data = num.asarray(num.fromstring(data, "int16"), num.float32)
+        available data.
+
+        Runs on the PortAudio thread: only copies the interleaved int16 chunk
+        into the ring buffer. De-interleaving is done by `flush`."""
+        if self._stop:
+            return None, pyaudio.paComplete
 
-        with _lock:
-            self.frames.append(data)
-            if self._stop:
-                return None, pyaudio.paComplete
+        wav_writer = self.wav_writer
+        if wav_writer is not None:
+            wav_writer.write(data)
 
-        self.flush()
+        self.audio_ring.write(
+            num.frombuffer(data, dtype=num.int16).reshape(-1, self.nchannels)
+        )
 
         return None, pyaudio.paContinue
 
     def get_frames(self):
-        """Read frames and empty pre-buffer."""
-        with _lock:
-            frames = self.frames
-            self.frames = []
-        return frames
+        """Read pending frames and empty pre-buffer."""
+        return self.audio_ring.read()
 
     def start(self):
         if self.stream is None:
             self.start_new_stream()
+            return
 
         self.stream.start_stream()
         self._stop = False
@@ -477,7 +1729,8 @@ class MicrophoneRecorder(DataProvider):
 
     def start_new_stream(self):
         """Start audio stream."""
-        self.frames = []
+        self.audio_ring = AudioRingBuffer(self.chunksize * 64, self.nchannels)
+        self.noverflow_reported = 0
         self.stream = self.paudio.open(
             format=pyaudio.paInt16,
             channels=self.nchannels,
@@ -493,19 +1746,39 @@ class MicrophoneRecorder(DataProvider):
         self.stream.start_stream()
 
     def stop(self):
-        with _lock:
-            self._stop = True
+        self._stop = True
         if self.stream is not None:
             self.stream.stop_stream()
 
+    def start_recording(self, fn):
+        """Stream the selected channels to WAV file *fn* until
+        `stop_recording` is called."""
+        self.stop_recording()
+        self.wav_writer = WavWriter(
+            fn, self.nchannels, self.sampling_rate, self.selected_channels
+        )
+
+    def stop_recording(self, wait=True):
+        wav_writer = self.wav_writer
+        self.wav_writer = None
+        if wav_writer is not None:
+            wav_writer.close(wait=wait)
+
     def close(self):
         self.stop()
         self.stream.close()
 
     def terminate(self):
+        self.stop_recording()
         if self.stream:
             self.close()
-        self.paudio.terminate()
+        if self.paudio is not None:
+            self.paudio.terminate()
+        if isinstance(self.buffer, MemmapBuffer):
+            self.buffer.close()
+
+        # a replaced input is not kept alive until exit
+        atexit.unregister(self.terminate)
         logger.debug("terminated stream")
 
     @property
@@ -513,10 +1786,295 @@ class MicrophoneRecorder(DataProvider):
         return 1.0 / self.sampling_rate
 
     def flush(self):
-        """ read data and put it into channels' track_data"""
-        # make this entirely numpy:
-        frames = num.array(self.get_frames())
-        for frame in frames:
-            r = num.reshape(frame, (self.chunksize, self.nchannels)).T
-            for channel, i in zip(self.channels, self.selected_channels):
-                channel.append(r[i])
+        """Read data and put it into channels' track_data.
+
+        Consumer side of `audio_ring`. Has to be called regularly from outside
+        the audio thread."""
+        noverflow = self.audio_ring.noverflow
+        if noverflow != self.noverflow_reported:
+            logger.warning(
+                "audio ring overflow: dropped %i chunks"
+                % (noverflow - self.noverflow_reported)
+            )
+            self.noverflow_reported = noverflow
+
+        frames = self.get_frames()
+        if not len(frames):
+            return
+
+        # de-interleave all selected channels at once into a contiguous
+        # (nselected, nsamples) block
+        self.buffer.append(
+            num.asarray(frames.T[self.selected_channels], dtype=num.float32)
+        )
+
+
+def to_int16_range(data):
+    """Scale samples of any wav sample format to the value range of 16 bit
+    integers, as delivered by the `MicrophoneRecorder`."""
+    if data.dtype.kind == "f":
+        return data * 2 ** 15
+    elif data.dtype == num.uint8:
+        return (data.astype(num.float32) - 128.0) * 2 ** 8
+    elif data.dtype.itemsize > 2:
+        return data / float(2 ** (8 * data.dtype.itemsize - 16))
+
+    return data
+
+
+class FileProvider(DataProvider):
+    """Reads an audio file block wise into the channels.
+
+    Blocks are read as fast as `flush` is called, i.e. faster than real time
+    if the Worker keeps up. Uses `soundfile` if installed (WAV, FLAC, ...),
+    otherwise memory maps WAV files via scipy. Sessions recorded by a
+    `MemmapBuffer` are read via `read_session`."""
+
+    def __init__(
+        self,
+        fn,
+        fftsize=1024,
+        hop_size=1024,
+        selected_channels=None,
+        block_length_seconds=10.0,
+    ):
+
+        DataProvider.__init__(self)
+        self.fn = fn
+        self.session = None
+
+        if os.path.exists(session_header_fn(fn)):
+            self.file = None
+            self.session, self.data = read_session(fn)
+            self.sampling_rate = self.session["sampling_rate"]
+            self.nsamples, self.nchannels = self.data.shape
+        else:
+            try:
+                import soundfile
+
+                self.file = soundfile.SoundFile(fn)
+                self.sampling_rate = self.file.samplerate
+                self.nchannels = self.file.channels
+                self.nsamples = self.file.frames
+            except ImportError:
+                self.file = None
+                self.sampling_rate, self.data = wavfile.read(fn, mmap=True)
+                if self.data.ndim == 1:
+                    self.data = self.data.reshape(-1, 1)
+
+                self.nsamples, self.nchannels = self.data.shape
+
+        self.selected_channels = selected_channels or list(range(self.nchannels))
+
+        self.buffer = MultiChannelRingBuffer(
+            len(self.selected_channels),
+            self.sampling_rate,
+            Channel.buffer_length_seconds,
+        )
+        self.channels = [
+            Channel(
+                self.sampling_rate,
+                fftsize=fftsize,
+                hop_size=hop_size,
+                buffer=self.buffer,
+                ichannel=i,
+            )
+            for i in range(len(self.selected_channels))
+        ]
+
+        # a block must never overwrite unprocessed samples, nor spectra
+        # which have not been read after processing it
+        self.block_size = min(
+            int(block_length_seconds * self.sampling_rate),
+            self.buffer.data_len - max(self.fftsizes),
+            min(c.fft.data_len * c.hop_size for c in self.channels),
+        )
+        self.i_read = 0
+
+    @property
+    def fftsizes(self):
+        return [c.fftsize for c in self.channels]
+
+    @property
+    def finished(self):
+        return self.i_read >= self.nsamples
+
+    def read(self, istart, n):
+        """Read *n* frames starting at frame *istart* as (n, nchannels)
+        array."""
+        if self.file is not None:
+            if self.file.tell() != istart:
+                self.file.seek(istart)
+            return self.file.read(n, dtype="int16", always_2d=True)
+
+        if self.session is not None:
+            # recorded in the value range of the MicrophoneRecorder
+            return self.data[istart : istart + n]
+
+        return to_int16_range(self.data[istart : istart + n])
+
+    def append_frames(self, frames):
+        """ Append the selected channels of (n, nchannels) *frames*."""
+        self.buffer.append(
+            num.asarray(frames.T[self.selected_channels], dtype=num.float32)
+        )
+
+    def flush(self):
+        """Append the next block to the channels."""
+        if self.finished:
+            return
+
+        frames = self.read(
+            self.i_read, min(self.block_size, self.nsamples - self.i_read)
+        )
+        self.i_read += len(frames)
+        self.append_frames(frames)
+
+    def terminate(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ReplayProvider(FileProvider):
+    """Replays an audio file at *speed* times real time.
+
+    Blocks are read ahead on a separate thread, so high speeds do not
+    stutter on slow disks. Supports pausing (`stop`), `seek` and changing
+    `speed` while playing."""
+
+    def __init__(
+        self,
+        fn,
+        fftsize=1024,
+        hop_size=1024,
+        selected_channels=None,
+        speed=1.0,
+        prefetch_seconds=4.0,
+        block_length_seconds=0.1,
+    ):
+        FileProvider.__init__(
+            self,
+            fn,
+            fftsize=fftsize,
+            hop_size=hop_size,
+            selected_channels=selected_channels,
+            block_length_seconds=block_length_seconds,
+        )
+        self.speed = speed
+
+        self._lock = threading.Lock()
+        self._stop = True
+        self._terminated = False
+        self._position = 0.0
+        self._t_last = time.time()
+        self._pending = None
+
+        # blocks are tagged with a generation which is incremented on seek
+        self._generation = 0
+        self._i_prefetch = 0
+        self._queue = queue.Queue(
+            maxsize=max(2, int(prefetch_seconds / block_length_seconds))
+        )
+        self._thread = threading.Thread(target=self.prefetch, daemon=True)
+        self._thread.start()
+
+    @property
+    def duration(self):
+        return self.nsamples / self.sampling_rate
+
+    @property
+    def position(self):
+        """ Current replay position in seconds."""
+        return self._position / self.sampling_rate
+
+    def prefetch(self):
+        """Read blocks ahead of the replay position into a queue."""
+        frames = None
+        while not self._terminated:
+            with self._lock:
+                generation = self._generation
+                istart = self._i_prefetch
+
+            if frames is None:
+                if istart >= self.nsamples:
+                    time.sleep(0.05)
+                    continue
+
+                frames = self.read(istart, min(self.block_size, self.nsamples - istart))
+
+            try:
+                self._queue.put((generation, frames), timeout=0.1)
+            except queue.Full:
+                if generation != self._generation:
+                    frames = None
+                continue
+
+            with self._lock:
+                if generation == self._generation:
+                    self._i_prefetch = istart + len(frames)
+
+            frames = None
+
+    def update_position(self):
+        now = time.time()
+        if not self._stop:
+            self._position = min(
+                self._position + (now - self._t_last) * self.speed * self.sampling_rate,
+                self.nsamples,
+            )
+        self._t_last = now
+
+    def flush(self):
+        """Append all prefetched samples up to the current replay position."""
+        with self._lock:
+            self.update_position()
+            while self.i_read < int(self._position):
+                if self._pending is None:
+                    try:
+                        generation, self._pending = self._queue.get_nowait()
+                    except queue.Empty:
+                        logger.debug("waiting for prefetched data")
+                        break
+
+                    if generation != self._generation:
+                        self._pending = None
+                        continue
+
+                n = min(len(self._pending), int(self._position) - self.i_read)
+                self.append_frames(self._pending[:n])
+                self.i_read += n
+                self._pending = self._pending[n:] if n < len(self._pending) else None
+
+    def start(self):
+        with self._lock:
+            self._t_last = time.time()
+            self._stop = False
+
+    def stop(self):
+        with self._lock:
+            self.update_position()
+            self._stop = True
+
+    def seek(self, t):
+        """ Continue replay at *t* seconds."""
+        with self._lock:
+            self._generation += 1
+            self._i_prefetch = min(max(int(t * self.sampling_rate), 0), self.nsamples)
+            self.i_read = self._i_prefetch
+            self._position = float(self._i_prefetch)
+            self._t_last = time.time()
+            self._pending = None
+
+            # unblock the prefetch thread
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+    def set_speed(self, speed):
+        with self._lock:
+            self.update_position()
+            self.speed = speed
+
+    def terminate(self):
+        self._terminated = True
+        self._thread.join()
+        FileProvider.terminate(self)
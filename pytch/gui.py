@@ -5,10 +5,12 @@ import os
 from abc import abstractmethod
 
 from pytch.processing import Worker
+from pytch.data import ReplayProvider
+from pytch.pitch_track import PitchTrackWriter
 
-from .gui_util import add_action_group
+from .gui_util import add_action_group, max_pooling_table, QPolygonFPool
 from .gui_util import make_QPolygonF, _color_names, _colors  # noqa
-from .util import consecutive, f2cent, index_gradient_filter, relative_keys
+from .util import f2cent, index_gradient_filter, relative_keys
 from .plot import GLAxis, Axis, GaugeWidget, MikadoWidget, FixGrid
 from .keyboard import KeyBoard
 from .menu import DeviceMenu, ProcessingMenu
@@ -28,6 +30,17 @@ logger = logging.getLogger("pytch.gui")
 tfollow = 3.0
 fmax = 2000.0
 colormaps = ["viridis", "wb", "bw"]
+spectrogram_histories = {"Latest": None, "10 min": 600.0, "1 h": 3600.0, "3 h": 10800.0}
+spectrogram_scales = ["Linear", "Semitones"]
+spectrum_averages = {
+    "1": (1, "frames"),
+    "2": (2, "frames"),
+    "3": (3, "frames"),
+    "4": (4, "frames"),
+    "5": (5, "frames"),
+    "1 s": (1.0, "s"),
+    "5 s": (5.0, "s"),
+}
 
 
 class SignalDispatcherWidget(qw.QWidget):
@@ -76,6 +89,10 @@ class SignalDispatcherWidget(qw.QWidget):
 
 
 class ChannelView(SignalDispatcherWidget):
+
+    # channel, averaging length in spectra and mode, see `SpectralAverage`
+    spectrum_average_changed = qc.pyqtSignal(object, int, str)
+
     def __init__(self, channel, color="red", *args, **kwargs):
         """
         Visual representation of a Channel instance.
@@ -97,13 +114,14 @@ class ChannelView(SignalDispatcherWidget):
         self.trace_widget.yticks = False
         self.trace_widget.set_ylim(-1000.0, 1000.0)
         self.trace_widget.left = 0.0
+        self.trace_line = None
 
         self.spectrogram_widget = SpectrogramWidget(channel=channel)
 
         self.spectrum_widget = SpectrumWidget(parent=self)
         #        self.plot_spectrum = self.spectrum_widget.plotlog
 
-        self.fft_smooth_factor = 4
+        self.fft_smooth_factor = "4"
 
         layout = self.layout()
         layout.addWidget(self.trace_widget)
@@ -122,9 +140,8 @@ class ChannelView(SignalDispatcherWidget):
         smooth_action_group = QActionGroup(self.fft_smooth_factor_menu)
         smooth_action_group.setExclusive(True)
         self.smooth_choices = []
-        for factor in range(5):
-            factor += 1
-            fft_smooth_action = QAction(str(factor), self.fft_smooth_factor_menu)
+        for factor in spectrum_averages:
+            fft_smooth_action = QAction(factor, self.fft_smooth_factor_menu)
 
             fft_smooth_action.triggered.connect(self.on_fft_smooth_select)
             fft_smooth_action.setCheckable(True)
@@ -134,6 +151,12 @@ class ChannelView(SignalDispatcherWidget):
             smooth_action_group.addAction(fft_smooth_action)
             self.fft_smooth_factor_menu.addAction(fft_smooth_action)
 
+        self.fft_smooth_factor_menu.addSeparator()
+        self.smooth_ema = QAction("Exponential", self.fft_smooth_factor_menu)
+        self.smooth_ema.setCheckable(True)
+        self.smooth_ema.triggered.connect(self.on_fft_smooth_select)
+        self.fft_smooth_factor_menu.addAction(self.smooth_ema)
+
         self.right_click_menu.addMenu(self.fft_smooth_factor_menu)
 
         self.spectrum_type_menu = QMenu("lin/log", self.right_click_menu)
@@ -152,22 +175,24 @@ class ChannelView(SignalDispatcherWidget):
 
     @qc.pyqtSlot()
     def on_draw(self):
-        self.trace_widget.clear()
-
         c = self.channel
-        d = c.fft.latest_frame_data(self.fft_smooth_factor)  # get latest frame data
 
-        # draw trace
-        self.trace_widget.plot(
-            *c.latest_frame(tfollow), ndecimate=25, color=self.color, line_width=1
-        )
+        # draw trace from the min/max envelope at about one bucket per pixel
+        x, y = c.latest_envelope(tfollow, self.trace_widget.width(), published=True)
+        if self.trace_line is None:
+            self.trace_widget.clear()
+            self.trace_line = self.trace_widget.plot(
+                x, y, color=self.color, line_width=1
+            )
+        else:
+            self.trace_widget.set_data(self.trace_line, x, y)
 
         # plot spectrum
-        self.spectrum_widget.plot_spectrum(c.freqs, num.mean(d, axis=0))
+        self.spectrum_widget.plot_spectrum(c.freqs, c.fft_average.mean(published=True))
 
-        confidence = c.pitch_confidence.latest_frame_data(1)
+        confidence = c.pitch_confidence.latest_frame_data(1, published=True)
         if confidence > self.confidence_threshold:
-            x = c.undo_pitch_proxy(c.get_latest_pitch())
+            x = c.undo_pitch_proxy(c.get_latest_pitch(published=True))
         #            self.spectrum_widget.axvline(x)
 
         if self.freq_keyboard:
@@ -200,6 +225,7 @@ class ChannelView(SignalDispatcherWidget):
         visible = self.spectrogram_widget.isVisible()
         self.show_spectrogram_widget(False)
         layout.removeWidget(self.spectrogram_widget)
+        self.spectrogram_widget.cleanup()
         del self.spectrogram_widget
         if rotate:
             self.spectrogram_widget = SpectrogramWidgetRotated(channel=self.channel)
@@ -228,14 +254,22 @@ class ChannelView(SignalDispatcherWidget):
     def on_fft_smooth_select(self):
         for c in self.smooth_choices:
             if c.isChecked():
-                self.fft_smooth_factor = int(c.text())
+                self.fft_smooth_factor = c.text()
                 break
 
+        n, unit = spectrum_averages[self.fft_smooth_factor]
+        if unit == "s":
+            n = round(n * self.channel.fft.sampling_rate)
+
+        mode = "ema" if self.smooth_ema.isChecked() else "window"
+        self.spectrum_average_changed.emit(self.channel, n, mode)
+
     @qc.pyqtSlot(bool)
     def on_color_select(self, triggered):
         for c in self.color_choices:
             if c.isChecked():
                 self.color = c.text()
+                self.trace_line = None
                 break
 
 
@@ -263,6 +297,7 @@ class ProductView(SignalDispatcherWidget):
         visible = self.spectrogram_widget.isVisible()
         self.show_spectrogram_widget(False)
         layout.removeWidget(self.spectrogram_widget)
+        self.spectrogram_widget.cleanup()
         del self.spectrogram_widget
 
         if rotate:
@@ -324,6 +359,10 @@ class ChannelViews(qw.QWidget):
     def show_product_widgets(self, show):
         self.views[-1].setVisible(show)
 
+    def cleanup(self):
+        for view in self.views:
+            view.spectrogram_widget.cleanup()
+
     def set_in_range(self, val_range):
         for c_view in self.views:
             c_view.trace_widget.set_ylim(-val_range, val_range)
@@ -351,37 +390,117 @@ class ChannelViews(qw.QWidget):
             yield view
 
 
-class SpectrogramWidget(Axis):
+class SpectrogramWidget(GLAxis):
+    vertical = False
+
     def __init__(self, channel, *args, **kwargs):
-        Axis.__init__(self, *args, **kwargs)
-        self.ny, self.nx = 100, 300
+        GLAxis.__init__(self, *args, **kwargs)
+        self.nframes = 100
         self.channel = channel
-        fake = num.ones((self.nx, self.ny))
-        self.image = self.colormesh(z=fake)
-        self.xticks = False
-        self.ytick_formatter = "%i"
+        self.semitones = False
+        self.image = None
+        self.setup_image()
+        if self.vertical:
+            self.yticks = False
+            self.xtick_formatter = "%i"
+        else:
+            self.xticks = False
+            self.ytick_formatter = "%i"
+        self.setup_right_click_menu()
+
+    def setup_image(self):
+        """Create the image for the selected frequency scale. Semitone
+        bins are labeled in cents relative to the standard frequency."""
+        self.nbins = self.channel.log_nbins if self.semitones else 300
+        self.i_drawn = None
+        self.cleanup()
+        self.clear()
+        self.image = self.scrolling_colormesh(
+            self.nframes, self.nbins, vertical=self.vertical
+        )
 
+    def setup_right_click_menu(self):
         self.right_click_menu = QMenu("RC", self)
         self.color_choices = add_action_group(
             colormaps, self.right_click_menu, self.on_color_select
         )
+        self.right_click_menu.addSeparator()
+        self.history_choices = add_action_group(
+            spectrogram_histories, self.right_click_menu, self.on_history_select
+        )
+        self.history_choices[0].setChecked(True)
+        self.history_seconds = None
+        if self.channel is not None:
+            self.right_click_menu.addSeparator()
+            self.scale_choices = add_action_group(
+                spectrogram_scales, self.right_click_menu, self.on_scale_select
+            )
+            self.scale_choices[0].setChecked(True)
+
+    def spectrogram_buffers(self):
+        """Spectra, spectrogram pyramid and frequencies of the selected
+        frequency scale."""
+        c = self.channel
+        if self.semitones:
+            cents = 1200.0 * num.log2(c.log_freqs / c.standard_frequency)
+            return c.log_fft, c.log_fft_pyramid, cents
+
+        return c.fft, c.fft_pyramid, c.freqs[: self.nbins]
+
+    def latest_spectrogram(self, nframes, nbins):
+        """Times and (nframes, nbins) array of the latest spectra.
+
+        If a history length is selected, the spectra are read from the
+        channel's spectrogram pyramid at screen resolution."""
+        c = self.channel
+        fft, pyramid, _ = self.spectrogram_buffers()
+        if self.history_seconds is None:
+            d = fft.latest_frame_data(nframes, published=True)
+            return c.xdata[-nframes:], d[:, :nbins]
+
+        n = int(self.history_seconds * fft.sampling_rate)
+        t = c.tmin + c.i_published * c.delta
+        x = num.linspace(t - self.history_seconds, t, nframes)
+        return x, pyramid.latest_image(n, nbins, (nframes, nbins), published=True)
 
     @qc.pyqtSlot()
     def update_spectrogram(self):
         c = self.channel
 
         try:
-            y = c.freqs[: self.nx]
-            x = c.xdata[-self.ny :]
-            d = c.fft.latest_frame_data(self.ny)
-            self.image.set_data(num.flipud(d[:, : self.nx].transpose()))
-            self.update_datalims(x, y)
+            _, _, f = self.spectrogram_buffers()
+            if self.history_seconds is None:
+                t = c.xdata[-self.nframes :]
+                self.append_latest_frames()
+            else:
+                t, d = self.latest_spectrogram(self.nframes, self.nbins)
+                self.image.set_frames(d)
+                self.i_drawn = None
+
+            if self.vertical:
+                self.update_datalims(f, t)
+            else:
+                self.update_datalims(t, f)
         except ValueError as e:
             logger.debug(e)
             return
 
         self.update()
 
+    def append_latest_frames(self):
+        """Pass only the spectra processed since the last update to the
+        image, or all of them if the spectrogram has been replaced."""
+        fft, _, _ = self.spectrogram_buffers()
+        # the worker keeps appending, draw up to the published frame
+        i = fft.i_published
+        nnew = i - self.i_drawn if self.i_drawn is not None else -1
+        if nnew < 0 or nnew >= self.nframes:
+            self.image.set_frames(fft.frame_data(i - self.nframes, i)[:, : self.nbins])
+        elif nnew:
+            self.image.append_frames(fft.frame_data(i - nnew, i)[:, : self.nbins])
+
+        self.i_drawn = i
+
     @qc.pyqtSlot()
     def on_color_select(self):
         for c in self.color_choices:
@@ -389,45 +508,43 @@ class SpectrogramWidget(Axis):
                 self.image.set_colortable(c.text())
                 break
 
+    @qc.pyqtSlot()
+    def on_history_select(self):
+        for c in self.history_choices:
+            if c.isChecked():
+                self.history_seconds = spectrogram_histories[c.text()]
+                break
+
+    @qc.pyqtSlot()
+    def on_scale_select(self):
+        for c in self.scale_choices:
+            if c.isChecked():
+                semitones = c.text() == "Semitones"
+                break
+
+        if semitones != self.semitones:
+            self.semitones = semitones
+            self.setup_image()
+            self.on_color_select()
+            self.update_spectrogram()
+
     @qc.pyqtSlot(qg.QMouseEvent)
     def mousePressEvent(self, mouse_ev):
         if mouse_ev.button() == qc.Qt.RightButton:
             self.right_click_menu.exec_(qg.QCursor.pos())
 
+    def cleanup(self):
+        """Free the OpenGL resources of the image. Call this before the
+        widget is deleted."""
+        if self.image is not None:
+            self.image.destroy_texture(self)
+
     def __del__(self):
         logger.debug("Spectrogram deleted")
 
 
 class SpectrogramWidgetRotated(SpectrogramWidget):
-    def __init__(self, channel, *args, **kwargs):
-        Axis.__init__(self, *args, **kwargs)
-        self.ny, self.nx = 300, 100
-        self.channel = channel
-        fake = num.ones((self.nx, self.ny))
-        self.image = self.colormesh(z=fake)
-        self.yticks = False
-        self.xtick_formatter = "%i"
-
-        self.right_click_menu = QMenu("RC", self)
-        self.color_choices = add_action_group(
-            colormaps, self.right_click_menu, self.on_color_select
-        )
-
-    @qc.pyqtSlot()
-    def update_spectrogram(self):
-        c = self.channel
-
-        try:
-            x = c.freqs[: self.ny]
-            y = c.xdata[-self.nx :]
-            d = c.fft.latest_frame_data(self.nx)
-            self.image.set_data(d[:, : self.ny])
-            self.update_datalims(x, y)
-        except ValueError as e:
-            logger.debug(e)
-            return
-
-        self.update()
+    vertical = True
 
 
 class SpectrumWidget(QChartView):
@@ -459,6 +576,10 @@ class SpectrumWidget(QChartView):
         self.series.attachAxis(self.axis_x)
         self.series.attachAxis(self.axis_y)
 
+        self.polygon_pool = QPolygonFPool()
+        self._pooling_key = None
+        self._pooling = None
+
     def setup_y_axis(self, type):
         # Setting Y-axis (gain)
         self.current_type = type
@@ -471,16 +592,52 @@ class SpectrumWidget(QChartView):
         self.axis_y.setMax(self.y_max)
         self.chart.addAxis(self.axis_y, qc.Qt.AlignLeft)
 
+    def pooling_table(self, x_data):
+        """Bin to pixel table of `max_pooling_table` for the frequencies
+        *x_data*, rebuilt when the plot area or the frequency axis change.
+        The pooled frequencies are written to the series' point buffer."""
+        key = (
+            len(x_data),
+            x_data[-1],
+            self.axis_x.min(),
+            self.axis_x.max(),
+            int(self.chart.plotArea().width()),
+            isinstance(self.axis_x, QLogValueAxis),
+        )
+        if key != self._pooling_key:
+            self._pooling = max_pooling_table(
+                x_data, key[2], key[3], max(key[4], 1), log=key[5]
+            )
+            self.polygon_pool.reset()
+            _, view = self.polygon_pool.get(len(self._pooling[2]))
+            view[:, 0] = self._pooling[3]
+            self._pooling_key = key
+
+        return self._pooling
+
     def plot_spectrum(self, x_data, y_data):
-        plot_points = qg.QPolygonF()
-        y_data[y_data <= 0] = 1
-        for i, x in enumerate(x_data):
-            plot_points << qc.QPointF(x, y_data[i])
-        data_y_max = num.amax(y_data)
+        """Draw the maximum of each pixel of the spectrum.
+
+        :param y_data: spectrum, or spectra of shape (n, len(x_data)) which
+            are averaged"""
+        istart, istop, offsets, _ = self.pooling_table(x_data)
+        if not len(offsets):
+            self.series.clear()
+            return
+
+        y_data = y_data[..., istart:istop]
+        if y_data.ndim == 2:
+            y_data = num.mean(y_data, axis=0)
+
+        polygon, view = self.polygon_pool.get(len(offsets), 0)
+        y = view[:, 1]
+        num.maximum.reduceat(y_data, offsets, out=y)
+        y[y <= 0] = 1
+        data_y_max = num.amax(y)
         if data_y_max > self.y_max:
             self.y_max = data_y_max
             self.axis_y.setMax(data_y_max)
-        self.series.replace(plot_points)
+        self.series.replace(polygon)
 
     def set_spectral_type(self, type):
         if self.current_type != type:
@@ -541,11 +698,38 @@ class OverView(qw.QWidget):
         action.setChecked(True)
         self.right_click_menu.addAction(action)
         self.attach_highlight_pitch_menu()
+        self.reset_scene()
 
-    def draw_highlighted(self, x):
-        for high_pitch, label in self.highlighted_pitches:
+    def reset_scene(self):
+        """Rebuild the scene with the highlighted pitches. Lines are added
+        by `set_line` and afterwards updated in place."""
+        self.ax.clear()
+        self.lines = {}
+        self.labels = []
+        self.highlighted = list(self.highlighted_pitches)
+        for high_pitch, label in self.highlighted:
             self.ax.axhline(high_pitch, line_width=2)
-            self.ax.text(x=x, y=high_pitch, text=label)
+            self.labels.append(self.ax.text(x=0.0, y=high_pitch, text=label))
+
+    def set_line(self, key, x, y, **style):
+        """Replace the data of line *key*, adding it on first use. Nan
+        values in *y* split the line."""
+        if self.highlighted != self.highlighted_pitches:
+            self.reset_scene()
+
+        line = self.lines.get(key)
+        if line is None:
+            self.lines[key] = self.ax.plot(x, y, **style)
+        else:
+            line.pen = self.ax.get_pen(
+                style["color"], style["line_width"], style.get("style", "solid")
+            )
+            self.ax.set_data(line, x, y)
+
+    def draw_highlighted(self, x):
+        """ Move the labels of the highlighted pitches to *x*."""
+        for label in self.labels:
+            label.set_data(x, label.y)
 
     def attach_highlight_pitch_menu(self):
         pmenu = QMenu("Highlight pitches", self)
@@ -597,29 +781,25 @@ class PitchWidget(OverView):
 
     @qc.pyqtSlot()
     def on_draw(self):
-        self.ax.clear()
         for i, cv in enumerate(self.channel_views):
-            x, y = cv.channel.pitch.latest_frame(self.tfollow, clip_min=True)
-            index = num.where(
-                cv.channel.pitch_confidence.latest_frame_data(len(x))
-                >= cv.confidence_threshold
+            x, y = cv.channel.pitch.latest_frame(
+                self.tfollow, clip_min=True, published=True
+            )
+            index = cv.channel.latest_confident_indices(
+                len(x), cv.confidence_threshold, published=True
             )[0]
 
             # TODO: attach filter 2000 to slider
             index_grad = index_gradient_filter(x, y, 2000)
             index = num.intersect1d(index, index_grad)
-            indices_grouped = consecutive(index)
-            for group in indices_grouped:
-                if len(group) == 0:
-                    continue
-                self.ax.plot(x[group], y[group], color=cv.color, line_width=4)
+            y_confident = num.full(len(y), num.nan)
+            y_confident[index] = y[index]
+            self.set_line(i, x, y_confident, color=cv.color, line_width=4)
 
             xstart = num.min(x)
             self.ax.set_xlim(xstart, xstart + self.tfollow)
-        try:
-            self.current_low_pitch[i] = y[indices_grouped[-1][-1]]
-        except IndexError as e:
-            pass
+        if len(index):
+            self.current_low_pitch[i] = y[index[-1]]
 
         self.low_pitch_changed.emit(self.current_low_pitch)
         self.draw_highlighted(xstart + self.tfollow)
@@ -627,18 +807,18 @@ class PitchWidget(OverView):
 
     @qc.pyqtSlot()
     def on_save_as(self):
-        _fn = QFileDialog().getSaveFileName(self, "Save as text file", ".", "")[0]
-        if _fn:
-            if not os.path.exists(_fn):
-                os.makedirs(_fn)
-            for i, cv in enumerate(self.channel_views):
-                fn = os.path.join(_fn, "channel%s.txt" % i)
-                x, y = cv.channel.pitch.xdata, cv.channel.pitch.ydata
-                index = num.where(
-                    cv.channel.pitch_confidence.latest_frame_data(len(x))
-                    >= cv.confidence_threshold
-                )
-                num.savetxt(fn, num.vstack((x[index], y[index])).T)
+        """Save pitches and confidences of all channels still in memory as
+        pitch track file (see `pytch.pitch_track`)."""
+        fn = QFileDialog().getSaveFileName(self, "Save pitches", ".", "*.ptrack")[0]
+        if fn:
+            channels = [cv.channel for cv in self.channel_views]
+            frame_index = channels[0].frame_index
+            istop = frame_index.i_published
+            istart = max(istop - frame_index.data_len, 0)
+
+            track = PitchTrackWriter.from_channels(fn, channels)
+            track.write_channels(channels, istart, istop)
+            track.close()
 
 
 class ImageWorker(qc.QObject):
@@ -671,10 +851,13 @@ class ImageWorker(qc.QObject):
     @qc.pyqtSlot()
     def process(self):
         z = num.asarray(
-            self.channels[0].fft.latest_frame_data(self.ny), dtype=num.float
+            self.channels[0].fft.latest_frame_data(self.ny, published=True),
+            dtype=num.float,
         )
         for c in self.channels:
-            z *= num.asarray(c.fft.latest_frame_data(self.ny), dtype=num.float)
+            z *= num.asarray(
+                c.fft.latest_frame_data(self.ny, published=True), dtype=num.float
+            )
 
         self.x = c.xdata[-self.ny :]
         self.y = c.freqs[: self.nx]
@@ -685,10 +868,13 @@ class ImageWorker(qc.QObject):
 class ImageWorkerRotated(ImageWorker):
     def process(self):
         z = num.asarray(
-            self.channels[0].fft.latest_frame_data(self.nx), dtype=num.float
+            self.channels[0].fft.latest_frame_data(self.nx, published=True),
+            dtype=num.float,
         )
         for c in self.channels:
-            z *= num.asarray(c.fft.latest_frame_data(self.nx), dtype=num.float)
+            z *= num.asarray(
+                c.fft.latest_frame_data(self.nx, published=True), dtype=num.float
+            )
 
         self.y = c.xdata[-self.nx :]
         self.x = c.freqs[: self.ny]
@@ -727,9 +913,11 @@ class ProductSpectrogram(SpectrogramWidget):
     def init_image_worker(self, rotate=False):
         self.thread = qc.QThread()
         if rotate:
-            self.image_worker = ImageWorkerRotated(self.channels, self.nx, self.ny)
+            self.image_worker = ImageWorkerRotated(
+                self.channels, self.nframes, self.nbins
+            )
         else:
-            self.image_worker = ImageWorker(self.channels, self.nx, self.ny)
+            self.image_worker = ImageWorker(self.channels, self.nbins, self.nframes)
         self.image_worker.moveToThread(self.thread)
         self.image_worker.processingFinished.connect(self.update_spectrogram)
         self.image_worker.start.emit("Start Thread")
@@ -769,6 +957,8 @@ class ProductSpectrogram(SpectrogramWidget):
 
 
 class ProductSpectrogramRotated(ProductSpectrogram):
+    vertical = True
+
     def __init__(self, channels, *args, **kwargs):
         SpectrogramWidgetRotated.__init__(self, None, *args, **kwargs)
 
@@ -795,10 +985,14 @@ class ProductSpectrum(SpectrumWidget):  # GLAxis):
     @qc.pyqtSlot()
     def on_draw(self):
         #        self.clear()
-        ydata = num.asarray(self.channels[0].fft.latest_frame_data(3), dtype=num.float)
+        ydata = num.asarray(
+            self.channels[0].fft.latest_frame_data(3, published=True), dtype=num.float
+        )
 
         for c in self.channels[1:]:
-            ydata *= num.asarray(c.fft.latest_frame_data(3), dtype=num.float)
+            ydata *= num.asarray(
+                c.fft.latest_frame_data(3, published=True), dtype=num.float
+            )
 
 
 #        self.plotlog(self.channels[0].freqs, num.mean(ydata, axis=0), ndecimate=2)
@@ -819,50 +1013,49 @@ class DifferentialPitchWidget(OverView):
 
     @qc.pyqtSlot()
     def on_draw(self):
-        self.ax.clear()
         for i1, cv1 in enumerate(self.channel_views):
-            x1, y1 = cv1.channel.pitch.latest_frame(tfollow, clip_min=True)
+            x1, y1 = cv1.channel.pitch.latest_frame(
+                tfollow, clip_min=True, published=True
+            )
             xstart = num.min(x1)
             index1 = cv1.channel.latest_confident_indices(
-                len(x1), cv1.confidence_threshold
+                len(x1), cv1.confidence_threshold, published=True
             )
             index1_grad = index_gradient_filter(x1, y1, self.derivative_filter)
             index1 = num.intersect1d(index1, index1_grad)
             for i2, cv2 in enumerate(self.channel_views):
                 if i1 >= i2:
                     continue
-                x2, y2 = cv2.channel.pitch.latest_frame(tfollow, clip_min=True)
+                x2, y2 = cv2.channel.pitch.latest_frame(
+                    tfollow, clip_min=True, published=True
+                )
                 index2_grad = index_gradient_filter(x2, y2, self.derivative_filter)
                 index2 = cv2.channel.latest_confident_indices(
-                    len(x2), cv2.confidence_threshold
+                    len(x2), cv2.confidence_threshold, published=True
                 )
 
                 index2 = num.intersect1d(index2, index2_grad)
                 indices = num.intersect1d(index1, index2)
-                indices_grouped = consecutive(indices)
-
-                for group in indices_grouped:
-                    if len(group) == 0:
-                        continue
-
-                    y = y1[group] - y2[group]
-                    x = x1[group]
-                    self.ax.plot(
-                        x,
-                        y,
-                        style="solid",
-                        line_width=4,
-                        color=cv1.color,
-                        antialiasing=False,
-                    )
-                    self.ax.plot(
-                        x,
-                        y,
-                        style=":",
-                        line_width=4,
-                        color=cv2.color,
-                        antialiasing=False,
-                    )
+                y = num.full(len(x1), num.nan)
+                y[indices] = y1[indices] - y2[indices]
+                self.set_line(
+                    (i1, i2, "solid"),
+                    x1,
+                    y,
+                    style="solid",
+                    line_width=4,
+                    color=cv1.color,
+                    antialiasing=False,
+                )
+                self.set_line(
+                    (i1, i2, ":"),
+                    x1,
+                    y,
+                    style=":",
+                    line_width=4,
+                    color=cv2.color,
+                    antialiasing=False,
+                )
 
         self.ax.set_xlim(xstart, xstart + tfollow)
         self.draw_highlighted(xstart)
@@ -905,18 +1098,22 @@ class PitchLevelDifferenceViews(qw.QWidget):
     def on_draw(self):
         for cv1, cv2, w in self.widgets:
             confidence1 = num.where(
-                cv1.channel.pitch_confidence.latest_frame_data(self.naverage)
+                cv1.channel.pitch_confidence.latest_frame_data(
+                    self.naverage, published=True
+                )
                 > cv1.confidence_threshold
             )
             confidence2 = num.where(
-                cv2.channel.pitch_confidence.latest_frame_data(self.naverage)
+                cv2.channel.pitch_confidence.latest_frame_data(
+                    self.naverage, published=True
+                )
                 > cv2.confidence_threshold
             )
             confidence = num.intersect1d(confidence1, confidence2)
             if len(confidence) > 1:
-                d1 = cv1.channel.pitch.latest_frame_data(self.naverage)[confidence]
-                d2 = cv2.channel.pitch.latest_frame_data(self.naverage)[confidence]
-                w.set_data(num.median(d1 - d2))
+                d1 = cv1.channel.pitch.latest_frame_data(self.naverage, published=True)
+                d2 = cv2.channel.pitch.latest_frame_data(self.naverage, published=True)
+                w.set_data(num.median(d1[confidence] - d2[confidence]))
             else:
                 w.set_data(None)
             w.update()
@@ -951,8 +1148,8 @@ class PitchLevelMikadoViews(qw.QWidget):
     @qc.pyqtSlot()
     def on_draw(self):
         for cv1, cv2, w in self.widgets:
-            x1, y1 = cv1.channel.pitch.latest_frame(w.tfollow)
-            x2, y2 = cv2.channel.pitch.latest_frame(w.tfollow)
+            x1, y1 = cv1.channel.pitch.latest_frame(w.tfollow, published=True)
+            x2, y2 = cv2.channel.pitch.latest_frame(w.tfollow, published=True)
             w.fill_between(x1, y1, x2, y2)
             w.update()
 
@@ -996,10 +1193,17 @@ class MainWidget(qw.QWidget):
         self.refresh_timer = qc.QTimer()
         self.refresh_timer.timeout.connect(self.refresh_widgets)
         self.menu = ProcessingMenu()
+        self.menu.record_button.toggled.connect(self.on_record)
+        self.menu.replay_speed.currentTextChanged.connect(self.on_replay_speed)
+        self.menu.replay_position_slider.sliderReleased.connect(self.on_replay_seek)
         self.input_dialog = DeviceMenu()
 
         self.input_dialog.set_input_callback = self.set_input
         self.data_input = None
+        self.channel_views_widget = None
+        self.worker = None
+        self.worker_thread = None
+        self.version_drawn = None
 
         # self.channel_mixer = ChannelMixer()
 
@@ -1017,8 +1221,6 @@ class MainWidget(qw.QWidget):
         menu.play_button.clicked.connect(self.data_input.start)
         menu.play_button.clicked.connect(self.refresh_timer.start)
 
-        menu.select_algorithm.currentTextChanged.connect(self.on_algorithm_select)
-
     @qc.pyqtSlot()
     def on_save_as(self):
         """Write traces to wav files"""
@@ -1030,22 +1232,79 @@ class MainWidget(qw.QWidget):
                 fn = os.path.join(_fn, "channel%s" % i)
                 tr.channel.save_as(fn, fmt="wav")
 
-    @qc.pyqtSlot(str)
-    def on_algorithm_select(self, arg):
-        """change pitch algorithm"""
-        for c in self.data_input.channels:
-            c.pitch_algorithm = arg
+    @qc.pyqtSlot(bool)
+    def on_record(self, checked):
+        """Start or stop streaming the input to a wav file"""
+        if not checked:
+            if self.data_input:
+                self.data_input.stop_recording(wait=False)
+            return
+
+        fn = QFileDialog().getSaveFileName(self, "Record to", ".", "*.wav")[0]
+        if not fn or not self.data_input:
+            self.menu.record_button.setChecked(False)
+            return
+
+        if not fn.endswith(".wav"):
+            fn += ".wav"
+
+        self.data_input.start_recording(fn)
+
+    @qc.pyqtSlot()
+    def on_replay_speed(self):
+        if isinstance(self.data_input, ReplayProvider):
+            self.data_input.set_speed(self.menu.replay_speed_factor)
+
+    @qc.pyqtSlot()
+    def on_replay_seek(self):
+        if isinstance(self.data_input, ReplayProvider):
+            self.data_input.seek(self.menu.replay_position_slider.value())
 
     def cleanup(self):
         """ clear all widgets. """
+        self.menu.record_button.setChecked(False)
+        self.stop_worker()
+
         if self.data_input:
             self.data_input.stop()
             self.data_input.terminate()
 
+        if self.channel_views_widget is not None:
+            self.channel_views_widget.cleanup()
+            self.channel_views_widget = None
+
         while self.top_layout.count():
             item = self.top_layout.takeAt(0)
             item.widget().deleteLater()
 
+    def stop_worker(self):
+        """ Stop the processing thread. """
+        if self.worker_thread:
+            self.menu.select_algorithm.currentTextChanged.disconnect(
+                self.worker.on_algorithm_select
+            )
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+            self.worker_thread = None
+
+    def init_worker(self):
+        """Run the Worker in its own thread, flushing and processing the
+        input independently of the refresh timer."""
+        self.stop_worker()
+        self.worker = Worker(
+            self.data_input.channels,
+            provider=self.data_input,
+            pitch_processes=get_config().pitch_processes,
+        )
+        self.worker_thread = qc.QThread()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.finished.connect(self.worker.stop, qc.Qt.DirectConnection)
+        self.menu.select_algorithm.currentTextChanged.connect(
+            self.worker.on_algorithm_select
+        )
+        self.worker.start.emit("Start Thread")
+        self.worker_thread.start()
+
     def set_input_dialog(self):
         """ Query device list and set the drop down menu"""
         self.refresh_timer.stop()
@@ -1056,12 +1315,13 @@ class MainWidget(qw.QWidget):
     def reset(self):
         dinput = self.data_input
 
-        self.worker = Worker(dinput.channels)
+        self.init_worker()
 
         self.channel_views_widget = ChannelViews(dinput.channels)
         channel_views = self.channel_views_widget.views[:-1]
         for cv in channel_views:
             self.menu.connect_to_confidence_threshold(cv)
+            cv.spectrum_average_changed.connect(self.worker.on_spectrum_average_select)
         self.signal_widgets_draw.connect(self.channel_views_widget.on_draw)
 
         self.top_layout.addWidget(self.channel_views_widget, 1, 0, 1, 1)
@@ -1106,15 +1366,32 @@ class MainWidget(qw.QWidget):
         self.cleanup()
         self.data_input = input
         # self.channel_mixer.set_channels(self.data_input.channels)
-        self.data_input.start_new_stream()
+        if isinstance(input, ReplayProvider):
+            input.set_speed(self.menu.replay_speed_factor)
+            self.menu.set_replay_controls_enabled(True, input.duration)
+        else:
+            self.menu.set_replay_controls_enabled(False)
+
+        self.data_input.start()
         self.make_connections()
 
         self.reset()
 
     @qc.pyqtSlot()
     def refresh_widgets(self):
-        """This is the main refresh loop."""
-        self.worker.process()
+        """This is the main refresh loop.
+
+        Only redraws if the Worker finished processing new data."""
+        version = self.worker.version
+        if version == self.version_drawn:
+            return
+
+        self.version_drawn = version
+        if isinstance(self.data_input, ReplayProvider):
+            slider = self.menu.replay_position_slider
+            if not slider.isSliderDown():
+                slider.setValue(int(self.data_input.position))
+
         self.signal_widgets_clear.emit()
         self.signal_widgets_draw.emit()
 
@@ -347,10 +347,16 @@ class Projection(object):
     def get_out_range(self):
         return self.ur
 
-    def __call__(self, x):
+    def __call__(self, x, out=None):
         umin, umax = self.ur
         xmin, xmax = self.xr
-        return umin + (x - xmin) * ((umax - umin) / (xmax - xmin))
+        if out is None:
+            return umin + (x - xmin) * ((umax - umin) / (xmax - xmin))
+
+        num.subtract(x, xmin, out=out)
+        num.multiply(out, (umax - umin) / (xmax - xmin), out=out)
+        num.add(out, umin, out=out)
+        return out
 
     def clipped(self, x):
         umin, umax = self.ur
@@ -383,6 +389,58 @@ def make_QPolygonF(xdata, ydata):
     return qpoints
 
 
+class QPolygonFPool(object):
+    """Reusable :py:class:`qg.QPolygonF` buffers of a widget.
+
+    Call `reset` before painting, then `get` hands out the polygons in the
+    same order on every paint. Polygons keep their capacity and are only
+    reallocated when the number of points grows."""
+
+    def __init__(self):
+        self.polygons = []
+        self.views = []
+        self.iused = 0
+
+    def reset(self):
+        self.iused = 0
+
+    def get(self, n, i=None):
+        """Next polygon, or polygon *i* if given, resized to *n* points and a
+        writable `(n, 2)` array of its coordinates."""
+        if i is None:
+            if self.iused == len(self.polygons):
+                self.polygons.append(qg.QPolygonF())
+                self.views.append(None)
+
+            i = self.iused
+            self.iused += 1
+
+        polygon = self.polygons[i]
+        if polygon.size() > n:
+            polygon.remove(n, polygon.size() - n)
+        elif polygon.size() < n:
+            polygon.fill(qc.QPointF(), n)
+
+        view = self.views[i]
+        if not n:
+            view = num.empty((0, 2))
+        elif view is None or len(view) != n:
+            vptr = polygon.data()
+            vptr.setsize(int(n * 8 * 2))
+            view = num.ndarray(shape=(n, 2), dtype=num.float64, buffer=_buffer(vptr))
+            self.views[i] = view
+
+        return polygon, view
+
+    def make_QPolygonF(self, xdata, ydata, xproj, yproj):
+        """Like `make_QPolygonF` but projects *xdata* and *ydata* directly
+        into a reused polygon."""
+        polygon, view = self.get(len(ydata))
+        xproj(xdata, out=view[:, 0])
+        yproj(ydata, out=view[:, 1])
+        return polygon
+
+
 def mean_decimation(d, ndecimate):
     """ Decimate signal by factor (int) *ndecimate* using averaging."""
     pad_size = int(math.ceil(float(d.size) / ndecimate) * ndecimate - d.size)
@@ -398,6 +456,63 @@ def minmax_decimation(d, ndecimate):
     return dout
 
 
+def m4_decimation(xdata, ydata, xmin, xmax, nbins):
+    """Reduce a line to the first, minimum, maximum and last point within each
+    of *nbins* equally wide columns between *xmin* and *xmax*.
+
+    Drawn as a polyline with one column per pixel, the result looks the same
+    as the full line. *xdata* has to be sorted and *ydata* finite.
+
+    :returns: decimated xdata and ydata"""
+    edges = num.linspace(xmin, xmax, nbins + 1)[1:-1]
+    starts = num.unique(num.searchsorted(xdata, edges))
+    starts = num.concatenate(([0], starts[(starts > 0) & (starts < len(xdata))]))
+    counts = num.diff(num.append(starts, len(xdata)))
+
+    indices = num.empty((len(starts), 4), dtype=num.int64)
+    indices[:, 0] = starts
+    indices[:, 3] = starts + counts - 1
+    for icol, reduce in ((1, num.minimum), (2, num.maximum)):
+        ismatch = num.flatnonzero(
+            ydata == num.repeat(reduce.reduceat(ydata, starts), counts)
+        )
+        indices[:, icol] = ismatch[num.searchsorted(ismatch, starts)]
+
+    indices.sort(axis=1)
+    indices = indices.ravel()
+    return xdata[indices], ydata[indices]
+
+
+def max_pooling_table(xdata, xmin, xmax, npixels, log=False):
+    """Group sorted positions *xdata* by the pixel they fall into on an axis
+    of *npixels* pixels between *xmin* and *xmax*.
+
+    Data at *xdata* is pooled to one point per non-empty pixel with
+    ``num.maximum.reduceat(ydata[istart:istop], offsets)``.
+
+    :param log: pixels are equally wide on a logarithmic axis
+    :returns: range *istart*, *istop* of *xdata* on the axis, *offsets* of
+        the pixels' first samples relative to *istart* and the mean position
+        of the samples in each pixel"""
+    xdata = num.asarray(xdata)
+    if log:
+        xmin = max(xmin, num.min(xdata[xdata > 0], initial=xmax))
+        edges = num.geomspace(xmin, xmax, npixels + 1)
+    else:
+        edges = num.linspace(xmin, xmax, npixels + 1)
+
+    istart = num.searchsorted(xdata, xmin, side="left")
+    istop = num.searchsorted(xdata, xmax, side="right")
+    if istop <= istart:
+        return istart, istart, num.empty(0, dtype=num.int64), num.empty(0)
+
+    x = xdata[istart:istop]
+    ipixel = num.searchsorted(edges, x, side="right")
+    offsets = num.flatnonzero(num.diff(ipixel, prepend=-1))
+    counts = num.diff(num.append(offsets, len(x)))
+    return istart, istop, offsets, num.add.reduceat(x, offsets) / counts
+
+
 class FloatQLineEdit(qw.QLineEdit):
     accepted_value = qc.pyqtSignal(float)
 
@@ -42,13 +42,43 @@
 #############################################################################
 
 import sys
+import numpy as num
 
 import PyQt5.QtCore as qc
 import PyQt5.QtGui as qg
 import PyQt5.QtWidgets as qw
 import PyQt5.QtOpenGL as qgl
+from PyQt5 import sip
 from pytch.gui_util import make_QPolygonF
 
+GL_TRIANGLE_STRIP = 0x0005
+
+# GLSL 1.10 (OpenGL 2.0), which is also supported by mesa's llvmpipe
+colormesh_vertex_shader = """
+attribute vec2 position;
+attribute vec2 texcoord;
+varying vec2 v_texcoord;
+
+void main()
+{
+    gl_Position = vec4(position, 0.0, 1.0);
+    v_texcoord = texcoord;
+}
+"""
+
+colormesh_fragment_shader = """
+uniform sampler2D frames;
+uniform sampler1D colormap;
+uniform float offset;
+varying vec2 v_texcoord;
+
+void main()
+{
+    float v = texture2D(frames, vec2(v_texcoord.s, v_texcoord.t + offset)).r;
+    gl_FragColor = texture1D(colormap, (v * 255.0 + 0.5) / 256.0);
+}
+"""
+
 
 class GLWidget(qgl.QGLWidget):
     def __init__(self, *args, **kwargs):
@@ -91,6 +121,131 @@ class GLWidget(qgl.QGLWidget):
             self.gl.glMatrixMode(self.gl.GL_MODELVIEW)
 
 
+class ColormeshTexture(object):
+    """Spectrogram frames in a circular texture of the current OpenGL
+    context.
+
+    Every row of the luminance texture holds one frame (spectrum). Rows are
+    overwritten with `upload` as new frames arrive, the oldest row is passed
+    to `draw` as an offset and the texture wraps around in the time
+    direction. Bytes are mapped to colors by a 1D lookup texture in the
+    fragment shader.
+    """
+
+    def __init__(self, nframes, nbins):
+        self.nframes = nframes
+        self.nbins = nbins
+
+        profile = qg.QOpenGLVersionProfile()
+        profile.setVersion(2, 0)
+        self.gl = qg.QOpenGLContext.currentContext().versionFunctions(profile)
+        if not self.gl:
+            raise Exception("OpenGL 2.0 functions not available")
+        self.gl.initializeOpenGLFunctions()
+
+        self.program = qg.QOpenGLShaderProgram()
+        if not (
+            self.program.addShaderFromSourceCode(
+                qg.QOpenGLShader.Vertex, colormesh_vertex_shader
+            )
+            and self.program.addShaderFromSourceCode(
+                qg.QOpenGLShader.Fragment, colormesh_fragment_shader
+            )
+            and self.program.link()
+        ):
+            raise Exception("Colormesh shaders failed: %s" % self.program.log())
+
+        self.transfer_options = qg.QOpenGLPixelTransferOptions()
+        self.transfer_options.setAlignment(1)
+
+        self.frames = qg.QOpenGLTexture(qg.QOpenGLTexture.Target2D)
+        self.frames.setSize(nbins, nframes)
+        self.frames.setFormat(qg.QOpenGLTexture.LuminanceFormat)
+        self.frames.allocateStorage(
+            qg.QOpenGLTexture.Luminance, qg.QOpenGLTexture.UInt8
+        )
+        self.frames.setMinMagFilters(qg.QOpenGLTexture.Linear, qg.QOpenGLTexture.Linear)
+        self.frames.setWrapMode(
+            qg.QOpenGLTexture.DirectionS, qg.QOpenGLTexture.ClampToEdge
+        )
+        self.frames.setWrapMode(qg.QOpenGLTexture.DirectionT, qg.QOpenGLTexture.Repeat)
+        self.colormap = None
+
+    def upload(self, frames, irow):
+        """Write *frames*, an uint8 array of shape (n, nbins), to the rows
+        starting at *irow*."""
+        frames = num.ascontiguousarray(frames, dtype=num.uint8)
+        self.frames.setData(
+            0,
+            irow,
+            0,
+            self.nbins,
+            len(frames),
+            1,
+            qg.QOpenGLTexture.Luminance,
+            qg.QOpenGLTexture.UInt8,
+            sip.voidptr(frames),
+            self.transfer_options,
+        )
+
+    def set_colortable(self, ctable):
+        """:param ctable: list of 256 `qRgb` colors"""
+        c = num.array(ctable, dtype=num.uint32)
+        rgba = num.ascontiguousarray(
+            num.array([c >> 16, c >> 8, c, c >> 24]).T & 0xFF, dtype=num.uint8
+        )
+        if self.colormap is None:
+            self.colormap = qg.QOpenGLTexture(qg.QOpenGLTexture.Target1D)
+            self.colormap.setSize(len(rgba))
+            self.colormap.setFormat(qg.QOpenGLTexture.RGBA8_UNorm)
+            self.colormap.allocateStorage(
+                qg.QOpenGLTexture.RGBA, qg.QOpenGLTexture.UInt8
+            )
+            self.colormap.setMinMagFilters(
+                qg.QOpenGLTexture.Nearest, qg.QOpenGLTexture.Nearest
+            )
+            self.colormap.setWrapMode(qg.QOpenGLTexture.ClampToEdge)
+
+        self.colormap.setData(
+            qg.QOpenGLTexture.RGBA,
+            qg.QOpenGLTexture.UInt8,
+            sip.voidptr(rgba),
+            self.transfer_options,
+        )
+
+    def draw(self, vertices, texcoords, offset):
+        """Draw a triangle strip.
+
+        :param vertices: four corners in normalized device coordinates
+        :param texcoords: texture coordinates of the corners
+        :param offset: texture coordinate of the oldest row"""
+        program = self.program
+        program.bind()
+        self.frames.bind(0, qg.QOpenGLTexture.ResetTextureUnit)
+        self.colormap.bind(1, qg.QOpenGLTexture.ResetTextureUnit)
+        program.setUniformValue("frames", 0)
+        program.setUniformValue("colormap", 1)
+        program.setUniformValue("offset", float(offset))
+        program.enableAttributeArray("position")
+        program.enableAttributeArray("texcoord")
+        program.setAttributeArray("position", [qg.QVector2D(*v) for v in vertices])
+        program.setAttributeArray("texcoord", [qg.QVector2D(*t) for t in texcoords])
+
+        self.gl.glDrawArrays(GL_TRIANGLE_STRIP, 0, len(vertices))
+
+        program.disableAttributeArray("position")
+        program.disableAttributeArray("texcoord")
+        self.colormap.release(1, qg.QOpenGLTexture.ResetTextureUnit)
+        self.frames.release(0, qg.QOpenGLTexture.ResetTextureUnit)
+        program.release()
+
+    def destroy(self):
+        """Free the textures. The widget's context has to be current."""
+        self.frames.destroy()
+        if self.colormap is not None:
+            self.colormap.destroy()
+
+
 if __name__ == "__main__":
 
     app = qw.QApplication(sys.argv)
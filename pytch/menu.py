@@ -5,11 +5,14 @@ from PyQt5 import QtGui as qg
 import numpy as num
 import logging
 import os
+import time
 
 from .gui_util import FloatQLineEdit, LineEditWithLabel, _colors
 from .util import cent2f
 from .data import get_input_devices, MicrophoneRecorder, is_input_device
+from .data import ReplayProvider
 from .data import get_sampling_rate_options
+from .data import get_pitch_algorithms, get_default_pitch_algorithm
 from .config import get_config
 
 
@@ -72,6 +75,11 @@ class DeviceMenu(qw.QDialog):
         self.nfft_choice = self.get_nfft_box()
         layout.addWidget(self.nfft_choice)
 
+        # select hop size
+        layout.addWidget(qw.QLabel("Hop Size in Samples"))
+        self.hop_size_choice = self.get_hop_size_box()
+        layout.addWidget(self.hop_size_choice)
+
         self.channel_selector_scroll = qw.QScrollArea()
         layout.addWidget(qw.QLabel("Select Channels"), 0, 2, 1, 1)
         layout.addWidget(self.channel_selector_scroll, 1, 2, 6, 1)
@@ -83,6 +91,11 @@ class DeviceMenu(qw.QDialog):
         self.select_input.currentIndexChanged.connect(self.update_channel_info)
         self.select_input.setCurrentIndex(default_device[0])
 
+        open_file_button = buttons.addButton(
+            "Open File", qw.QDialogButtonBox.ActionRole
+        )
+        open_file_button.clicked.connect(self.on_open_file_clicked)
+
         buttons.accepted.connect(self.on_ok_clicked)
         buttons.rejected.connect(self.close)
         layout.addWidget(buttons)
@@ -113,22 +126,60 @@ class DeviceMenu(qw.QDialog):
         b.setCurrentIndex(3)
         return b
 
+    def get_hop_size_box(self):
+        """ Return a qw.QComboBox for selecting the hop size of the analysis"""
+        b = qw.QComboBox()
+        b.addItems([str(f) for f in [256, 512, 1024, 2048, 4096]])
+        b.setCurrentIndex(2)
+        return b
+
     @qc.pyqtSlot()
     def on_ok_clicked(self):
         selected_channels = self.channel_selector.get_selected_channels()
         logger.debug("selected channels: %s" % selected_channels)
         fftsize = int(self.nfft_choice.currentText())
+
+        session_fn = None
+        session_dir = get_config().session_dir
+        if session_dir:
+            if not os.path.exists(session_dir):
+                os.makedirs(session_dir)
+            session_fn = os.path.join(
+                session_dir, time.strftime("session_%Y%m%d_%H%M%S.f32")
+            )
+            logger.info("recording session to %s" % session_fn)
+
         recorder = MicrophoneRecorder(
             chunksize=1024,
             device_no=self.select_input.currentIndex(),
             sampling_rate=int(self.edit_sampling_rate.currentText()),
             fftsize=int(fftsize),
+            hop_size=int(self.hop_size_choice.currentText()),
             selected_channels=selected_channels,
+            session_fn=session_fn,
         )
 
         self.set_input_callback(recorder)
         self.hide()
 
+    @qc.pyqtSlot()
+    def on_open_file_clicked(self):
+        """Replay a recorded file instead of a live input device"""
+        fn = qw.QFileDialog().getOpenFileName(
+            self, "Open File", ".", "Audio (*.wav *.flac *.ogg *.f32)"
+        )[0]
+        if not fn:
+            return
+
+        provider = ReplayProvider(
+            fn,
+            fftsize=int(self.nfft_choice.currentText()),
+            hop_size=int(self.hop_size_choice.currentText()),
+        )
+
+        self.set_input_callback(provider)
+        self.hide()
+
 
 class ProcessingMenu(qw.QFrame):
 
@@ -154,6 +205,25 @@ class ProcessingMenu(qw.QFrame):
         self.save_as_button = qw.QPushButton("Save as")
         layout.addWidget(self.save_as_button, 1, 1)
 
+        self.record_button = qw.QPushButton("Record")
+        self.record_button.setCheckable(True)
+        layout.addWidget(self.record_button, 2, 0)
+
+        self.replay_speed = qw.QComboBox()
+        self.replay_speed.addItems(["0.5x", "1x", "2x", "4x", "8x"])
+        self.replay_speed.setCurrentIndex(1)
+        layout.addWidget(self.replay_speed, 2, 1)
+
+        self.replay_position_slider = qw.QSlider()
+        self.replay_position_slider.setOrientation(qc.Qt.Horizontal)
+        layout.addWidget(self.replay_position_slider, 3, 0, 1, 2)
+        self.replay_position_label = qw.QLabel("")
+        layout.addWidget(self.replay_position_label, 3, 2)
+        self.replay_position_slider.valueChanged.connect(
+            lambda x: self.replay_position_label.setText("%i:%02i" % divmod(x, 60))
+        )
+        self.set_replay_controls_enabled(False)
+
         layout.addWidget(qw.QLabel("Confidence Threshold"), 4, 0)
         self.noise_thresh_slider = qw.QSlider()
         self.noise_thresh_slider.setRange(0, 15)
@@ -181,18 +251,11 @@ class ProcessingMenu(qw.QFrame):
 
         layout.addWidget(qw.QLabel("Select Algorithm"), 7, 0)
         self.select_algorithm = qw.QComboBox(self)
-        algorithms = [
-            "default",
-            "schmitt",
-            "fcomb",
-            "mcomb",
-            "specacf",
-            "yin",
-            "yinfft",
-            "yinfast",
-        ]
+        algorithms = get_pitch_algorithms()
         self.select_algorithm.addItems(algorithms)
-        self.select_algorithm.setCurrentIndex(algorithms.index("yinfast"))
+        self.select_algorithm.setCurrentIndex(
+            algorithms.index(get_default_pitch_algorithm())
+        )
 
         layout.addWidget(self.select_algorithm, 7, 1)
 
@@ -248,6 +311,18 @@ class ProcessingMenu(qw.QFrame):
         self.setSizePolicy(qw.QSizePolicy.Minimum, qw.QSizePolicy.Minimum)
         self.setup_palette()
 
+    def set_replay_controls_enabled(self, enabled, duration=0.0):
+        """Replay controls are only enabled when replaying a file."""
+        self.replay_speed.setEnabled(enabled)
+        self.replay_position_slider.setEnabled(enabled)
+        self.replay_position_slider.setRange(0, int(duration))
+        self.replay_position_slider.setValue(0)
+        self.record_button.setEnabled(not enabled)
+
+    @property
+    def replay_speed_factor(self):
+        return float(self.replay_speed.currentText().rstrip("x"))
+
     def setup_palette(self):
         pal = self.palette()
         pal.setColor(qg.QPalette.Background, qg.QColor(*_colors["aluminium1"]))
@@ -0,0 +1,164 @@
+"""Binary pitch track files
+
+A file consists of
+
+- the magic bytes `PYTCHTRK`,
+- the length of the header in bytes (uint32, little endian),
+- a JSON header with per-channel metadata, padded to 8 bytes,
+- fixed size records of time (float64, seconds), pitch in cents relative to
+  each channel's `standard_frequency` and confidence (float32 per channel).
+
+Records are only appended, so a file is valid at any time while writing.
+Reading memory maps the records: time range queries bisect the time column
+and only touch the requested part of the file.
+"""
+
+import os
+import json
+import struct
+import logging
+import numpy as num
+
+from pytch.util import cent2f
+
+logger = logging.getLogger("pytch.pitch_track")
+
+MAGIC = b"PYTCHTRK"
+
+
+def record_dtype(nchannels):
+    return num.dtype(
+        [
+            ("time", "<f8"),
+            ("pitch", "<f4", (nchannels,)),
+            ("confidence", "<f4", (nchannels,)),
+        ]
+    )
+
+
+class PitchTrackWriter(object):
+    """Incrementally writes pitch tracks of several channels to a file."""
+
+    def __init__(
+        self, fn, nchannels, standard_frequency=220.0, pitch_shift=0.0, names=None
+    ):
+        """
+        :param standard_frequency: reference frequency of the pitches in cents.
+            Scalar or one per channel
+        :param pitch_shift: scalar or one per channel"""
+        self.nchannels = nchannels
+        self.dtype = record_dtype(nchannels)
+        self.header = {
+            "nchannels": nchannels,
+            "standard_frequency": list(
+                num.broadcast_to(standard_frequency, nchannels).astype(float)
+            ),
+            "pitch_shift": list(num.broadcast_to(pitch_shift, nchannels).astype(float)),
+            "names": names or ["channel%i" % i for i in range(nchannels)],
+        }
+
+        header = json.dumps(self.header).encode("utf-8")
+        header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+        self.file = open(fn, "wb")
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    @classmethod
+    def from_channels(cls, fn, channels):
+        return cls(
+            fn,
+            len(channels),
+            standard_frequency=[c.standard_frequency for c in channels],
+            pitch_shift=[c.pitch_shift for c in channels],
+            names=[c.name or "channel%i" % i for i, c in enumerate(channels)],
+        )
+
+    def write(self, time, pitch, confidence):
+        """Append records.
+
+        :param time: array of shape (n,)
+        :param pitch: pitch in cents of shape (n, nchannels)
+        :param confidence: array of shape (n, nchannels)"""
+        records = num.empty(len(time), dtype=self.dtype)
+        records["time"] = time
+        records["pitch"] = pitch
+        records["confidence"] = confidence
+        self.file.write(records.tobytes())
+
+    def write_channels(self, channels, istart, istop):
+        """Append processed frames *istart* to *istop* from the buffers of
+        *channels* (`pytch.data.Channel` instances sharing a hop size)."""
+        c0 = channels[0]
+        self.write(
+            c0.frame_index.frame_data(istart, istop) * c0.delta,
+            num.array([c.pitch.frame_data(istart, istop) for c in channels]).T,
+            num.array(
+                [c.pitch_confidence.frame_data(istart, istop) for c in channels]
+            ).T,
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class PitchTrack(object):
+    """Memory mapped pitch track file written by `PitchTrackWriter`."""
+
+    def __init__(self, fn):
+        with open(fn, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Exception("%s is not a pitch track file" % fn)
+
+            (nheader,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(nheader).decode("utf-8"))
+
+        self.nchannels = self.header["nchannels"]
+        self.standard_frequency = num.array(self.header["standard_frequency"])
+        self.pitch_shift = num.array(self.header["pitch_shift"])
+        self.names = self.header["names"]
+
+        dtype = record_dtype(self.nchannels)
+        offset = len(MAGIC) + 4 + nheader
+        # ignore an incomplete record at the end of a file still written to
+        nrecords = (os.path.getsize(fn) - offset) // dtype.itemsize
+        if nrecords:
+            self.records = num.memmap(
+                fn, dtype=dtype, mode="r", offset=offset, shape=(nrecords,)
+            )
+        else:
+            self.records = num.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def time(self):
+        return self.records["time"]
+
+    @property
+    def pitch(self):
+        return self.records["pitch"]
+
+    @property
+    def confidence(self):
+        return self.records["confidence"]
+
+    def get_slice(self, tmin=None, tmax=None):
+        """ Slice of records with tmin <= time < tmax."""
+        time = self.time
+        istart = 0 if tmin is None else num.searchsorted(time, tmin, side="left")
+        istop = len(time) if tmax is None else num.searchsorted(time, tmax, side="left")
+        return slice(istart, istop)
+
+    def query(self, tmin=None, tmax=None):
+        """Time, pitch in cents and confidence of records between *tmin* and
+        *tmax* as arrays."""
+        records = self.records[self.get_slice(tmin, tmax)]
+        return (
+            num.array(records["time"]),
+            num.array(records["pitch"]),
+            num.array(records["confidence"]),
+        )
+
+    def to_frequency(self, pitch):
+        """ Convert pitches in cents of all channels to Hz."""
+        return cent2f(pitch - self.pitch_shift, self.standard_frequency)
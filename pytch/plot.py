@@ -4,8 +4,8 @@ import scipy.interpolate as interpolate
 import logging
 
 from pytch.gui_util import PlotBase
-from pytch.gui_util import AutoScaler, Projection, minmax_decimation
-from pytch.gui_util import make_QPolygonF, _colors, _pen_styles  # noqa
+from pytch.gui_util import AutoScaler, Projection, minmax_decimation, m4_decimation
+from pytch.gui_util import make_QPolygonF, QPolygonFPool, _colors, _pen_styles  # noqa
 from . import viridis
 
 from PyQt5 import QtCore as qc
@@ -15,10 +15,11 @@ from PyQt5 import QtWidgets as qw
 logger = logging.getLogger("pytch.plot")
 
 try:
-    from pytch.gui_util_opengl import GLWidget
+    from pytch.gui_util_opengl import GLWidget, ColormeshTexture
 except AttributeError as e:
     logger.debug(e)
     GLWidget = qw.QWidget
+    ColormeshTexture = None
 
 d2r = num.pi / 180.0
 logger = logging.getLogger(__name__)
@@ -435,6 +436,60 @@ class SceneItem:
         self.pen = pen
         self.x = x
         self.y = y
+        self.projected = None
+        self.dirty = False
+
+    def set_data(self, x=None, y=None):
+        """ Replace the data in place and mark the item for projection."""
+        self.x = x
+        self.y = y
+        self.dirty = True
+
+    def set_projected(self, u, v, polygon_pool=None):
+        """ Set pixel coordinates *u* and *v* of x and y."""
+        self.projected = (u, v)
+        self.dirty = False
+
+    def project(self, xproj, yproj):
+        self.set_projected(
+            xproj(num.atleast_1d(self.x)) if self.x is not None else None,
+            yproj(num.atleast_1d(self.y)) if self.y is not None else None,
+        )
+
+
+def project_scene_items(items, xproj, yproj, polygon_pool=None, reset_pool=True):
+    """Project the coordinates of all *items* to pixels in one vectorized
+    pass over the concatenated coordinates and hand the slices to the
+    items' `set_projected`.
+
+    :param reset_pool: hand out the polygons of *polygon_pool* anew. If
+        false, items keep the polygons they got before."""
+    items = [item for item in items if isinstance(item, SceneItem)]
+    if not items:
+        return
+
+    xs = [num.atleast_1d(item.x) if item.x is not None else [] for item in items]
+    ys = [num.atleast_1d(item.y) if item.y is not None else [] for item in items]
+    us = num.split(
+        xproj(num.concatenate(xs).astype(num.float64)),
+        num.cumsum([len(x) for x in xs])[:-1],
+    )
+    vs = num.split(
+        yproj(num.concatenate(ys).astype(num.float64)),
+        num.cumsum([len(y) for y in ys])[:-1],
+    )
+
+    if polygon_pool is not None and reset_pool:
+        polygon_pool.reset()
+        for item in items:
+            item.pool_index = None
+
+    for item, u, v in zip(items, us, vs):
+        item.set_projected(
+            u if item.x is not None else None,
+            v if item.y is not None else None,
+            polygon_pool,
+        )
 
 
 class AxHLine(SceneItem):
@@ -442,12 +497,15 @@ class AxHLine(SceneItem):
         SceneItem.__init__(self, y=y, pen=pen)
 
     def draw(self, painter, xproj, yproj, rect=None):
+        if self.projected is None:
+            self.project(xproj, yproj)
+
         xmin, xmax = xproj.get_out_range()
-        y = yproj(self.y)
+        y = self.projected[1][0]
 
         painter.save()
         painter.setPen(self.pen)
-        painter.drawLine(xmin, y, xmax, y)
+        painter.drawLine(qc.QLineF(xmin, y, xmax, y))
         painter.restore()
 
 
@@ -456,12 +514,15 @@ class AxVLine(SceneItem):
         SceneItem.__init__(self, x=x, pen=pen)
 
     def draw(self, painter, xproj, yproj, rect=None):
+        if self.projected is None:
+            self.project(xproj, yproj)
+
         ymin, ymax = yproj.get_out_range()
-        x = xproj(self.x)
+        x = self.projected[0][0]
 
         painter.save()
         painter.setPen(self.pen)
-        painter.drawLine(x, ymin, x, ymax)
+        painter.drawLine(qc.QLineF(x, ymin, x, ymax))
         painter.restore()
 
 
@@ -471,32 +532,70 @@ class Points(SceneItem):
     def __init__(self, x, y, pen, antialiasing=True):
         SceneItem.__init__(self, x=x, y=y, pen=pen)
         self.antialiasing = antialiasing
+        self.qpoints = None
+        self.pool_index = None
+
+    def set_projected(self, u, v, polygon_pool=None):
+        """Write the pixel coordinates to a polygon, reused from
+        *polygon_pool* if given."""
+        self.dirty = False
+        if polygon_pool is None:
+            self.qpoints = make_QPolygonF(u, v)
+            return
+
+        if self.pool_index is None:
+            self.qpoints, view = polygon_pool.get(len(u))
+            self.pool_index = polygon_pool.iused - 1
+        else:
+            self.qpoints, view = polygon_pool.get(len(u), self.pool_index)
+
+        view[:, 0] = u
+        view[:, 1] = v
 
     def draw(self, painter, xproj, yproj, rect=None):
-        qpoints = make_QPolygonF(xproj(self.x), yproj(self.y))
+        if self.qpoints is None:
+            self.project(xproj, yproj)
+
         painter.save()
         if self.antialiasing:
             painter.setRenderHint(qg.QPainter.Antialiasing, True)
         painter.setPen(self.pen)
-        painter.drawPoints(qpoints)
+        painter.drawPoints(self.qpoints)
         painter.restore()
 
 
-class Polyline(SceneItem):
-    """ Holds and draws data projected to screen dimensions."""
+class Polyline(Points):
+    """Holds and draws data projected to screen dimensions. Nan values
+    split the line into separate segments."""
 
-    def __init__(self, x, y, pen, antialiasing=True):
-        SceneItem.__init__(self, x=x, y=y, pen=pen)
-        self.antialiasing = antialiasing
+    def __init__(self, *args, **kwargs):
+        Points.__init__(self, *args, **kwargs)
+        self.segments = None
+
+    def set_projected(self, u, v, polygon_pool=None):
+        Points.set_projected(self, u, v, polygon_pool)
+        finite = num.isfinite(u) & num.isfinite(v)
+        if finite.all():
+            self.segments = None
+            return
+
+        # start and length of each run of finite points
+        edges = num.flatnonzero(num.diff(num.concatenate(([0], finite, [0]))))
+        self.segments = list(zip(edges[::2], edges[1::2] - edges[::2]))
 
     def draw(self, painter, xproj, yproj, rect=None):
-        qpoints = make_QPolygonF(xproj(self.x), yproj(self.y))
+        if self.qpoints is None:
+            self.project(xproj, yproj)
 
         painter.save()
         painter.setPen(self.pen)
         if self.antialiasing:
             painter.setRenderHint(qg.QPainter.Antialiasing, True)
-        painter.drawPolyline(qpoints)
+        if self.segments is None:
+            painter.drawPolyline(self.qpoints)
+        else:
+            for istart, n in self.segments:
+                painter.drawPolyline(self.qpoints.mid(int(istart), int(n)))
         painter.restore()
 
 
@@ -506,7 +605,11 @@ class Text(SceneItem):
         self.text = qg.QStaticText(str(text))
 
     def draw(self, painter, xproj, yproj, rect=None):
-        painter.drawStaticText(qc.QPoint(xproj(self.x) * 0.9, yproj(self.y)), self.text)
+        if self.projected is None:
+            self.project(xproj, yproj)
+
+        u, v = self.projected
+        painter.drawStaticText(qc.QPointF(u[0] * 0.9, v[0]), self.text)
 
 
 class PColormesh(qw.QWidget):
@@ -573,6 +676,231 @@ class PColormesh(qw.QWidget):
         self.img.setColorTable(get_colortable(name))
 
 
+class ScrollingColormesh(PColormesh):
+    """Spectrogram which scrolls as new frames (spectra) are appended.
+
+    The image is a ring buffer of frames with a write cursor `iframe`: each
+    frame is prescaled once and written to its column (or row, if
+    *vertical*) of the `QImage`. Painting blits the part after the cursor
+    (the oldest frames) and the part before it in two pieces.
+
+    On OpenGL widgets (`GLAxis`) only the frames appended since the last
+    paint are uploaded to a circular texture (see `ColormeshTexture`),
+    scrolling is a texture coordinate offset and the colortable is applied
+    on the GPU.
+
+    :param vertical: if False, time runs along the x axis and frequency
+        along the y axis. If True, frequency runs along the x axis and time
+        downwards.
+    """
+
+    def __init__(self, nframes, nbins, vertical=False, *args, **kwargs):
+        if vertical:
+            ny, nx = nbins, nframes
+        else:
+            ny, nx = nframes, nbins
+
+        img = qg.QImage(ny, nx, qg.QImage.Format_Indexed8)
+        img.setColorTable(get_colortable(self.colortable))
+        PColormesh.__init__(self, img, num.arange(nx), num.arange(ny), *args, **kwargs)
+
+        # scan lines of indexed images are padded to 32 bit
+        buff = self.img.bits()
+        buff.setsize(self.img.sizeInBytes())
+        self.img_data = num.ndarray(
+            shape=(nx, ny),
+            dtype=num.uint8,
+            buffer=buff,
+            strides=(self.img.bytesPerLine(), 1),
+        )
+        self.img_data[:, :] = 0
+
+        self.nframes = nframes
+        self.nbins = nbins
+        self.vertical = vertical
+        self.iframe = 0
+        self.pending = []
+        self.texture = None
+        self.texture_failed = False
+        self.colortable_stale = True
+
+    @property
+    def frames(self):
+        """ The ring buffer of frames, a (nframes, nbins) view of the image."""
+        if self.vertical:
+            return self.img_data
+        else:
+            return self.img_data[::-1].T
+
+    def set_frames(self, frames):
+        """ Replace all frames by *frames* of shape (n, nbins)."""
+        frames = frames[-self.nframes :]
+        n = len(frames)
+        self.frames[: self.nframes - n] = 0
+        self.frames[self.nframes - n :] = self.prescale(frames)
+        self.iframe = 0
+        self.pending = [(0, self.nframes)]
+
+    def append_frames(self, frames):
+        """Append *frames* of shape (n, nbins) at the write cursor,
+        overwriting the oldest frames."""
+        n = len(frames)
+        if n >= self.nframes:
+            self.set_frames(frames)
+            return
+
+        istart = self.iframe
+        istop = istart + n
+        nwrapped = max(istop - self.nframes, 0)
+        self.frames[istart : istop - nwrapped] = self.prescale(frames[: n - nwrapped])
+        self.frames[:nwrapped] = self.prescale(frames[n - nwrapped :])
+        self.pending.append((istart, istop - nwrapped))
+        if nwrapped:
+            self.pending.append((0, nwrapped))
+
+        if sum(stop - start for (start, stop) in self.pending) >= self.nframes:
+            self.pending = [(0, self.nframes)]
+
+        self.iframe = istop % self.nframes
+
+    def ordered_frames(self):
+        """ Frames from oldest to latest."""
+        return num.concatenate((self.frames[self.iframe :], self.frames[: self.iframe]))
+
+    def set_data(self, *args):
+        """
+        :param args: z(2d) or x, y, z(2d) as arrays, oriented like the
+            displayed image
+        """
+        if len(args) == 3:
+            x, y, z = args
+        elif len(args) == 1:
+            (z,) = args
+        else:
+            raise Exception("Invalid number of arguments to *set_data*")
+
+        if self.vertical:
+            self.set_frames(z)
+        else:
+            self.set_frames(num.flipud(z).T)
+
+    def set_colortable(self, name):
+        PColormesh.set_colortable(self, name)
+        self.colortable_stale = True
+
+    def draw(self, painter, xproj, yproj, rect=None):
+        if (
+            ColormeshTexture is not None
+            and not self.texture_failed
+            and painter.paintEngine().type() == qg.QPaintEngine.OpenGL2
+        ):
+            painter.beginNativePainting()
+            try:
+                self.draw_texture(painter.device(), rect)
+                return
+            except Exception as e:
+                logger.warning("OpenGL colormesh failed, using QImage: %s" % e)
+                self.texture_failed = True
+                self.texture = None
+            finally:
+                painter.endNativePainting()
+
+        self.draw_image(painter, rect)
+
+    def draw_image(self, painter, rect):
+        """ Blit the oldest frames and the latest frames around the cursor."""
+        rect = qc.QRectF(rect)
+        nold = self.nframes - self.iframe
+        if self.vertical:
+            split = rect.height() * nold / self.nframes
+            parts = [
+                (
+                    qc.QRectF(0, self.iframe, self.nbins, nold),
+                    qc.QRectF(rect.left(), rect.top(), rect.width(), split),
+                ),
+                (
+                    qc.QRectF(0, 0, self.nbins, self.iframe),
+                    qc.QRectF(
+                        rect.left(),
+                        rect.top() + split,
+                        rect.width(),
+                        rect.height() - split,
+                    ),
+                ),
+            ]
+        else:
+            split = rect.width() * nold / self.nframes
+            parts = [
+                (
+                    qc.QRectF(self.iframe, 0, nold, self.nbins),
+                    qc.QRectF(rect.left(), rect.top(), split, rect.height()),
+                ),
+                (
+                    qc.QRectF(0, 0, self.iframe, self.nbins),
+                    qc.QRectF(
+                        rect.left() + split,
+                        rect.top(),
+                        rect.width() - split,
+                        rect.height(),
+                    ),
+                ),
+            ]
+
+        painter.save()
+        painter.setRenderHint(qg.QPainter.SmoothPixmapTransform, True)
+        for source, target in parts:
+            if not source.isEmpty():
+                painter.drawImage(target, self.img, source)
+        painter.restore()
+
+    def destroy_texture(self, widget):
+        """Free the texture, if any, in the context of the OpenGL *widget*
+        it was drawn on."""
+        if self.texture is None:
+            return
+
+        widget.makeCurrent()
+        self.texture.destroy()
+        widget.doneCurrent()
+        self.texture = None
+
+    def draw_texture(self, device, rect):
+        if self.texture is None:
+            self.texture = ColormeshTexture(self.nframes, self.nbins)
+            self.pending = [(0, self.nframes)]
+            self.colortable_stale = True
+
+        if self.colortable_stale:
+            self.texture.set_colortable(self.img.colorTable())
+            self.colortable_stale = False
+
+        for istart, istop in self.pending:
+            self.texture.upload(self.frames[istart:istop], istart)
+        self.pending = []
+
+        w = device.width()
+        h = device.height()
+        x0 = 2.0 * rect.left() / w - 1.0
+        x1 = 2.0 * (rect.left() + rect.width()) / w - 1.0
+        y0 = 1.0 - 2.0 * (rect.top() + rect.height()) / h
+        y1 = 1.0 - 2.0 * rect.top() / h
+
+        # sample the first and last rows at their centers, otherwise the
+        # latest and the oldest frame are blended across the wrap around
+        t0 = 0.5 / self.nframes
+        t1 = 1.0 - t0
+        if self.vertical:
+            texcoords = [(0.0, t1), (1.0, t1), (0.0, t0), (1.0, t0)]
+        else:
+            texcoords = [(0.0, t0), (0.0, t1), (1.0, t0), (1.0, t1)]
+
+        self.texture.draw(
+            [(x0, y0), (x1, y0), (x0, y1), (x1, y1)],
+            texcoords,
+            self.iframe / self.nframes,
+        )
+
+
 def MakeAxis(gl=True):
     if gl:
         WidgetBase = GLWidget
@@ -615,6 +943,10 @@ def MakeAxis(gl=True):
             self.xtick_formatter = "%s"
             self.xzoom = 0.0
 
+            self.scene_version = 0
+            self._projection_key = None
+            self._deco_key = None
+            self._deco_pixmap = None
             self.clear()
             self.grids = [AutoGrid()]
             self.__want_minor_grid = True
@@ -632,11 +964,95 @@ def MakeAxis(gl=True):
             self._yvisible = num.empty(0)
             self.yproj = Projection()
             self.xproj = Projection()
+            self.polygon_pool = QPolygonFPool()
             self.colormap = Colormap()
             self.setAutoFillBackground(True)
 
         def clear(self):
             self.scene_items = []
+            self.scene_version += 1
+
+        def add_item(self, item):
+            self.scene_items.append(item)
+            self.scene_version += 1
+
+        def project_scene(self):
+            """Project all scene items to pixels if the items or the
+            projections changed since the last paint. Otherwise only items
+            changed by `set_data` are projected."""
+            key = (
+                self.scene_version,
+                self.xproj.xr,
+                self.xproj.ur,
+                self.yproj.xr,
+                self.yproj.ur,
+            )
+            if key == self._projection_key:
+                dirty = [i for i in self.scene_items if getattr(i, "dirty", False)]
+                if dirty:
+                    project_scene_items(
+                        dirty,
+                        self.xproj,
+                        self.yproj,
+                        self.polygon_pool,
+                        reset_pool=False,
+                    )
+                return
+
+            project_scene_items(
+                self.scene_items, self.xproj, self.yproj, self.polygon_pool
+            )
+            self._projection_key = key
+
+        def deco_pixmap(self):
+            """Axes, ticks, labels and grids rendered to a pixmap which is
+            reused until the size, the layout or the data ranges change."""
+            key = (
+                self.width(),
+                self.height(),
+                self.left,
+                self.right,
+                self.top,
+                self.bottom,
+                self.xproj.xr,
+                self.xproj.ur,
+                self.yproj.xr,
+                self.yproj.ur,
+                self._xmin,
+                self._xmax,
+                self._ymin,
+                self._ymax,
+                self._xinc,
+                self._yinc,
+                self.xticks,
+                self.yticks,
+                self.xlabels,
+                self.ylabels,
+                self.xtick_formatter,
+                self.ytick_formatter,
+                tuple(self.grids),
+            )
+            if key != self._deco_key:
+                # time following axes change the key on every paint, only
+                # allocate a new pixmap if the size changed
+                ratio = self.devicePixelRatioF()
+                pixmap = self._deco_pixmap
+                if (
+                    pixmap is None
+                    or pixmap.size() != self.size() * ratio
+                    or pixmap.devicePixelRatioF() != ratio
+                ):
+                    pixmap = qg.QPixmap(self.size() * ratio)
+                    pixmap.setDevicePixelRatio(ratio)
+                pixmap.fill(qc.Qt.transparent)
+                painter = qg.QPainter(pixmap)
+                painter.setFont(self.font())
+                self.draw_deco(painter)
+                painter.end()
+                self._deco_pixmap = pixmap
+                self._deco_key = key
+
+            return self._deco_pixmap
 
         def setup_annotation_boxes(self):
             """ left and top boxes containing labels, dashes, marks, etc."""
@@ -657,7 +1073,7 @@ def MakeAxis(gl=True):
             self,
             xdata=None,
             ydata=None,
-            ndecimate=0,
+            ndecimate=None,
             style="solid",
             color="black",
             line_width=1,
@@ -667,7 +1083,11 @@ def MakeAxis(gl=True):
             """plot data
 
             :param *args:  ydata | xdata, ydata
+            :param ndecimate: fixed min/max decimation factor. By default,
+                lines with more than 4 points per pixel are reduced to 4
+                points per pixel (see `m4_decimation`). 0 disables decimation.
             :param ignore_nan: skip values which are nan
+            :returns: the scene item, which can be updated with `set_data`
             """
             if ydata is None:
                 return
@@ -675,6 +1095,41 @@ def MakeAxis(gl=True):
                 self.update_datalims([0], [0])
                 return
 
+            xvisible, yvisible = self.visible_data(xdata, ydata, ndecimate, ignore_nan)
+
+            pen = self.get_pen(color, line_width, style)
+            if style == "o":
+                item = Points(
+                    x=xvisible, y=yvisible, pen=pen, antialiasing=antialiasing
+                )
+            else:
+                item = Polyline(
+                    x=xvisible, y=yvisible, pen=pen, antialiasing=antialiasing
+                )
+
+            self.add_item(item)
+            self.update_datalims(xvisible, yvisible)
+            self.update()
+            return item
+
+        def set_data(self, item, xdata, ydata, ndecimate=None, ignore_nan=False):
+            """Replace the data of scene *item*, as returned by `plot`, in
+            place. Other items are not projected again unless the data
+            limits change."""
+            if len(ydata) == 0:
+                item.set_data(num.empty(0), num.empty(0))
+                self.update_datalims([0], [0])
+            else:
+                xvisible, yvisible = self.visible_data(
+                    xdata, ydata, ndecimate, ignore_nan
+                )
+                item.set_data(xvisible, yvisible)
+                self.update_datalims(xvisible, yvisible)
+
+            self.update()
+
+        def visible_data(self, xdata, ydata, ndecimate=None, ignore_nan=False):
+            """ Data to draw after removing nans and decimation."""
             if xdata is None:
                 xdata = num.arange(len(ydata))
 
@@ -683,40 +1138,55 @@ def MakeAxis(gl=True):
                 xdata = xdata[~ydata.mask]
                 ydata = ydata[~ydata.mask]
 
-            if ndecimate != 0:
+            if ndecimate is None:
+                return self.pixel_decimation(xdata, ydata)
+            elif ndecimate != 0:
                 # self._xvisible = minmax_decimation(xdata, ndecimate)
-                xvisible = xdata[::ndecimate]
-                yvisible = minmax_decimation(ydata, ndecimate)
                 # self._yvisible = smooth(ydata, window_len=ndecimate*2)[::ndecimate]
                 # index = num.arange(0, len(self._xvisible), ndecimate)
-            else:
-                xvisible = xdata
-                yvisible = ydata
-
-            pen = self.get_pen(color, line_width, style)
-            if style == "o":
-                self.scene_items.append(
-                    Points(x=xvisible, y=yvisible, pen=pen, antialiasing=antialiasing)
-                )
-            else:
-                self.scene_items.append(
-                    Polyline(x=xvisible, y=yvisible, pen=pen, antialiasing=antialiasing)
-                )
-
-            self.update_datalims(xvisible, yvisible)
-            self.update()
+                return xdata[::ndecimate], minmax_decimation(ydata, ndecimate)
+
+            return xdata, ydata
+
+        def pixel_decimation(self, xdata, ydata):
+            """Decimate lines to at most 4 points per pixel of the canvas
+            within the visible x range."""
+            npixels = self.canvas_rect().width()
+            if (
+                npixels <= 0
+                or len(xdata) <= 4 * npixels
+                or isinstance(ydata, num.ma.MaskedArray)
+            ):
+                return xdata, ydata
+
+            xdata = num.asarray(xdata)
+            ydata = num.asarray(ydata)
+            xmin = self.xmin if self.xmin else xdata[0]
+            xmax = self.xmax if self.xmax else xdata[-1]
+            if (
+                not xmax > xmin
+                or num.any(num.diff(xdata) < 0)
+                or not num.all(num.isfinite(ydata))
+            ):
+                return xdata, ydata
+
+            return m4_decimation(xdata, ydata, xmin, xmax, npixels)
 
         def axvline(self, x, **pen_args):
             pen = self.get_pen(**pen_args)
-            self.scene_items.append(AxVLine(x=x, pen=pen))
+            self.add_item(AxVLine(x=x, pen=pen))
 
         def axhline(self, y, **pen_args):
             pen = self.get_pen(**pen_args)
-            self.scene_items.append(AxHLine(y=y, pen=pen))
+            item = AxHLine(y=y, pen=pen)
+            self.add_item(item)
+            return item
 
         def text(self, x, y, text, **pen_args):
             pen = self.get_pen(**pen_args)
-            self.scene_items.append(Text(x=x, y=y, pen=pen, text=text))
+            item = Text(x=x, y=y, pen=pen, text=text)
+            self.add_item(item)
+            return item
 
         def colormesh(self, x=None, y=None, z=None, **pen_args):
 
@@ -728,17 +1198,28 @@ def MakeAxis(gl=True):
                 x = num.arange(nx)
 
             spec = PColormesh.from_numpy_array(x=x, y=y, z=z)
-            self.scene_items.append(spec)
+            self.add_item(spec)
             self.update_datalims(x, y)
 
             return spec
 
+        def scrolling_colormesh(self, nframes, nbins, vertical=False):
+            """ Add a `ScrollingColormesh` to which frames can be appended."""
+            spec = ScrollingColormesh(nframes, nbins, vertical=vertical)
+            self.add_item(spec)
+            if vertical:
+                self.update_datalims(num.arange(nbins), num.arange(nframes))
+            else:
+                self.update_datalims(num.arange(nframes), num.arange(nbins))
+
+            return spec
+
         def fill_between(self, xdata, ydata1, ydata2, *args, **kwargs):
             x = num.hstack((xdata, xdata[::-1]))
             y = num.hstack((ydata1, ydata2[::-1]))
             self.update_datalims(x, y)
 
-        def plotlog(self, xdata=None, ydata=None, ndecimate=0, **style_kwargs):
+        def plotlog(self, xdata=None, ydata=None, ndecimate=None, **style_kwargs):
             try:
                 self.plot(xdata, num.ma.log(ydata), ndecimate=ndecimate, **style_kwargs)
             except ValueError as e:
@@ -788,8 +1269,9 @@ def MakeAxis(gl=True):
             """this is executed e.g. when self.repaint() is called. Draws the
             underlying data and scales the content to fit into the widget."""
             painter = qg.QPainter(self)
-            self.draw_deco(painter)
+            painter.drawPixmap(0, 0, self.deco_pixmap())
             rect = self.canvas_rect()
+            self.project_scene()
             for item in self.scene_items:
                 item.draw(painter, self.xproj, self.yproj, rect=rect)
 
@@ -965,4 +1447,4 @@ class MikadoWidget(Axis):
             painter.setPen(pens[iline])
             painter.drawLine(line)
             painter.restore()
-        self.draw_deco(painter)
+        painter.drawPixmap(0, 0, self.deco_pixmap())
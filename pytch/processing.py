@@ -1,38 +1,544 @@
 # -*- coding: utf-8 -*-
 import PyQt5.QtCore as qc
 import numpy as num
+import os
 import logging
+import atexit
+import multiprocessing
+
+from collections import defaultdict
+from functools import lru_cache, partial
+from numpy.lib.format import open_memmap
+from numpy.lib.stride_tricks import as_strided
+from pytch.data import make_pitch_detector, FileProvider
+from pytch.pitch_track import PitchTrackWriter
+
+try:
+    # multithreaded and caches FFT plans between calls
+    from scipy.fft import rfft as _rfft, irfft as _irfft
+
+    rfft = partial(_rfft, workers=-1)
+    irfft = partial(_irfft, workers=-1)
+except ImportError:
+    rfft = num.fft.rfft
+    irfft = num.fft.irfft
 
 logger = logging.getLogger("pytch.processing")
 
 
+def estimate_pitch(channel, hops):
+    """Pitch and confidence of consecutive *hops* of shape (nhops, hop_size)
+    using the *channel*'s pitch detector."""
+    pitch = num.empty(len(hops), dtype=num.float32)
+    confidence = num.empty(len(hops), dtype=num.float32)
+    for ihop, hop in enumerate(hops):
+        pitch[ihop] = channel.pitch_o(hop)[0]
+        confidence[ihop] = channel.pitch_o.get_confidence()
+
+    return pitch, confidence
+
+
+def yin(frames, sampling_rate, threshold=0.15):
+    """Vectorized YIN pitch estimation (de Cheveigne and Kawahara, 2002).
+
+    The difference function is computed via FFT based autocorrelation for
+    all frames at once.
+
+    :param frames: array of shape (..., n). Lags up to n // 2 are searched.
+    :param sampling_rate: sampling rate in Hz
+    :param threshold: absolute threshold of the cumulative mean normalized
+        difference function
+    :returns: pitch in Hz and confidence, both of shape frames.shape[:-1]"""
+    frames = num.asarray(frames, dtype=num.float64)
+    n = frames.shape[-1]
+    w = n // 2
+    nfft = 2 ** int(num.ceil(num.log2(n + w)))
+
+    # r[tau] = sum_j x[j] * x[j + tau] for j < w
+    r = irfft(rfft(frames, nfft) * rfft(frames[..., :w], nfft).conj(), nfft)
+    r = r[..., :w]
+
+    energy = num.zeros(frames.shape[:-1] + (n + 1,))
+    num.cumsum(frames ** 2, axis=-1, out=energy[..., 1:])
+    diff = energy[..., w : w + 1] + energy[..., w:n] - energy[..., :w] - 2.0 * r
+    diff[..., 0] = 0.0
+    num.maximum(diff, 0.0, out=diff)
+
+    # cumulative mean normalized difference
+    cmnd = num.ones_like(diff)
+    cumdiff = num.cumsum(diff[..., 1:], axis=-1)
+    num.divide(
+        diff[..., 1:] * num.arange(1, w),
+        cumdiff,
+        out=cmnd[..., 1:],
+        where=cumdiff > 0.0,
+    )
+
+    # first local minimum below threshold, global minimum otherwise
+    inner = cmnd[..., 1 : w - 1]
+    candidates = (inner < threshold) & (inner <= cmnd[..., 2:w])
+    tau = num.where(
+        candidates.any(axis=-1),
+        num.argmax(candidates, axis=-1),
+        num.argmin(inner, axis=-1),
+    )
+    tau = (tau + 1)[..., num.newaxis]
+
+    # parabolic interpolation
+    a, b, c = (num.take_along_axis(cmnd, tau + i, axis=-1)[..., 0] for i in (-1, 0, 1))
+    denom = a - 2.0 * b + c
+    shift = num.zeros_like(denom)
+    num.divide(0.5 * (a - c), denom, out=shift, where=denom != 0.0)
+    num.clip(shift, -0.5, 0.5, out=shift)
+
+    pitch = sampling_rate / (tau[..., 0] + shift)
+    confidence = num.clip(1.0 - b, 0.0, 1.0)
+    return pitch, confidence
+
+
+@lru_cache(maxsize=16)
+def get_window(n):
+    """ Cached, read-only hanning window of length *n*."""
+    win = num.hanning(n)
+    win.flags.writeable = False
+    return win
+
+
 class Worker(qc.QObject):
-    def __init__(self, channels):
+
+    processingFinished = qc.pyqtSignal(int)
+    start = qc.pyqtSignal(str)
+
+    # upper limit of samples transformed in one batched FFT call
+    max_batch_size = 2 ** 22
+
+    # interval in milliseconds at which the provider is polled for new audio
+    poll_interval = 10
+
+    def __init__(self, channels, provider=None, pitch_processes=0):
         """
         The Worker does the signal processing in its' `process` method.
 
-        :param channels: list of `pytch.data.Channel` instances"""
+        It is meant to be moved to its own `QThread` and started via the
+        `start` signal. It then polls *provider* for new audio, processes it
+        and increments `version` once all channels are updated. Views read
+        the buffers only up to the fill indices published along with each
+        version, see `pytch.data.Channel.publish`.
+
+        :param channels: list of `pytch.data.Channel` instances
+        :param provider: `pytch.data.DataProvider` to be flushed before
+            processing
+        :param pitch_processes: if larger than 0, estimate pitches in a
+            `PitchPool` of that many processes"""
 
         super(Worker, self).__init__()
         self.channels = channels
+        self.provider = provider
+        self.pitch_pool = None
+        if pitch_processes > 0:
+            self.pitch_pool = PitchPool(channels, pitch_processes)
+        self.version = 0
+        self.start.connect(self.run)
+
+    @qc.pyqtSlot(str)
+    def run(self, message):
+        self.processing_timer = qc.QTimer()
+        self.processing_timer.timeout.connect(self.update)
+        self.processing_timer.start(self.poll_interval)
+
+    @qc.pyqtSlot()
+    def stop(self):
+        """Stop polling. Has to be called from within the processing thread,
+        e.g. connected to its `finished` signal."""
+        self.processing_timer.stop()
+        if self.pitch_pool is not None:
+            self.pitch_pool.close()
+
+    @qc.pyqtSlot()
+    def update(self):
+        """Flush the provider and process everything which arrived since.
+
+        Emits `processingFinished` with the new version if anything was
+        processed."""
+        if self.provider is not None:
+            self.provider.flush()
+
+        if self.process():
+            for channel in self.channels:
+                channel.publish()
+            self.version += 1
+            self.processingFinished.emit(self.version)
+
+    @qc.pyqtSlot(str)
+    def on_algorithm_select(self, algorithm):
+        """Change pitch algorithm from within the processing thread."""
+        for c in self.channels:
+            c.pitch_algorithm = algorithm
+
+    @qc.pyqtSlot(object, int, str)
+    def on_spectrum_average_select(self, channel, n, mode):
+        """Change the spectral averaging of *channel* from within the
+        processing thread."""
+        channel.set_spectrum_average(n, mode)
 
     def process(self):
-        """Process the channels' data and update the channel instances."""
+        """Process the channels' data and update the channel instances.
+
+        Computes one spectrum and pitch estimate for every hop which arrived
+        since the last call, independent of how often this is called.
+        Channels sharing a `pytch.data.ChannelAnalysis` are transformed
+        together in a single batched FFT.
+
+        Returns the number of processed hops."""
         logger.debug("processing data")
 
-        for ic, channel in enumerate(self.channels):
-            frame_work = channel.latest_frame_data(channel.fftsize)
-            win = num.hanning(channel.fftsize)
-            # slight pre-emphasis
-            # frame_work[1:] -=  0.1 * frame_work[:-1]
-            # frame_work[0] = frame_work[1]
+        groups = defaultdict(list)
+        for channel in self.channels:
+            fftsize = channel.fftsize
+            hop_size = channel.hop_size
+
+            # skip hops which have already been overwritten
+            i_oldest = channel.i_filled - channel.data_len + fftsize
+            if channel.i_processed < i_oldest:
+                nskip = -((channel.i_processed - i_oldest) // hop_size)
+                logger.warning("processing too slow: skipping %i hops" % nskip)
+                channel.i_processed += nskip * hop_size
+
+            groups[id(channel.analysis)].append(channel)
+
+        return sum(self.process_channels(channels) for channels in groups.values())
+
+    def process_channels(self, channels):
+        """Process all pending hops of *channels*, which have to share the same
+        `pytch.data.ChannelAnalysis`.
+
+        Returns the number of processed hops."""
+        c0 = channels[0]
+        fftsize = c0.fftsize
+        hop_size = c0.hop_size
+        rows = [c.ichannel for c in channels]
+        win = get_window(fftsize)
+
+        nhops_batch = max(1, self.max_batch_size // (len(channels) * fftsize))
+        nhops_pending = (c0.i_filled - c0.i_processed) // hop_size
+        nhops_total = nhops_pending
+        while nhops_pending > 0:
+            nhops = min(nhops_pending, nhops_batch)
+            nhops_pending -= nhops
+
+            i_stop = c0.i_processed + nhops * hop_size
+            i_start = i_stop - (nhops - 1) * hop_size - fftsize
+            data = c0.buffer.frame_data(i_start, i_stop)[rows]
+
+            # (nchannels, nhops, fftsize) overlapping windows on data
+            frames = as_strided(
+                data,
+                shape=(len(channels), nhops, fftsize),
+                strides=(data.strides[0], hop_size * data.strides[1], data.strides[1]),
+                writeable=False,
+            )
+
+            spec = rfft(frames * win, axis=-1)
+            amp_spec = (spec.real ** 2 + spec.imag ** 2) / fftsize
+            num.minimum(amp_spec, num.iinfo(num.uint32).max, out=amp_spec)
+            amp_spec = num.asarray(amp_spec, dtype=num.uint32)
+
+            frame_index = num.arange(
+                c0.i_processed + hop_size, i_stop + 1, hop_size, dtype=num.int64
+            )
+
+            estimates = self.estimate_pitches(channels, frames)
+            pitch, confidence = num.swapaxes(num.array(estimates, num.float32), 0, 1)
+            log_spec = num.array(
+                [c.to_log_frequency(s) for c, s in zip(channels, amp_spec)]
+            )
+            c0.analysis.append(rows, amp_spec, log_spec, pitch, confidence, frame_index)
+
+            for ic, channel in enumerate(channels):
+                channel.fft_pyramid.append(amp_spec[ic])
+                channel.fft_average.append(amp_spec[ic])
+                channel.log_fft_pyramid.append(log_spec[ic])
+
+            c0.i_processed = i_stop
+
+        return nhops_total * len(channels)
+
+    def estimate_pitches(self, channels, frames):
+        """Pitch and confidence arrays per channel for *frames* of shape
+        (nchannels, nhops, fftsize)."""
+        estimates = [None] * len(channels)
+
+        # numpy yin works on full frames of all channels at once
+        iyin = [ic for ic, c in enumerate(channels) if c.pitch_o is None]
+        if iyin:
+            pitch, confidence = yin(frames[iyin], channels[0].sampling_rate)
+            for i, ic in enumerate(iyin):
+                estimates[ic] = (pitch[i], confidence[i])
+
+        # aubio keeps the last window internally and expects the new hop
+        iaubio = [ic for ic, c in enumerate(channels) if c.pitch_o is not None]
+        hops = [frames[ic, :, -channels[ic].hop_size :] for ic in iaubio]
+        if self.pitch_pool is not None and iaubio:
+            results = self.pitch_pool.process([channels[ic] for ic in iaubio], hops)
+        else:
+            results = [estimate_pitch(channels[ic], h) for ic, h in zip(iaubio, hops)]
+
+        for ic, result in zip(iaubio, results):
+            estimates[ic] = result
+
+        return estimates
+
+
+def _run_pitch_shard(conn, name_in, name_out, shape, parameters):
+    """Main loop of a pitch estimation process.
+
+    Waits for the number of hops per channel to be sent through *conn*,
+    estimates pitch and confidence of the hops found in shared memory block
+    *name_in* and writes them to *name_out*. Stops when receiving `None`."""
+    from multiprocessing import shared_memory
+
+    shm_in = shared_memory.SharedMemory(name=name_in)
+    shm_out = shared_memory.SharedMemory(name=name_out)
+    hops = num.ndarray(shape, dtype=num.float32, buffer=shm_in.buf)
+    out = num.ndarray(shape[:2] + (2,), dtype=num.float32, buffer=shm_out.buf)
+    detectors = [make_pitch_detector(*p) for p in parameters]
+
+    while True:
+        nhops = conn.recv()
+        if nhops is None:
+            break
+
+        for ic, (detector, n) in enumerate(zip(detectors, nhops)):
+            hop_size = parameters[ic][2]
+            for ihop in range(n):
+                out[ic, ihop, 0] = detector(hops[ic, ihop, :hop_size])[0]
+                out[ic, ihop, 1] = detector.get_confidence()
+
+        conn.send(True)
+
+    del hops, out
+    shm_in.close()
+    shm_out.close()
+
+
+class PitchShard(object):
+    """A process estimating pitches of a subset of channels. Audio hops and
+    results are exchanged through shared memory."""
+
+    def __init__(self, channels, max_hops, context):
+        from multiprocessing import shared_memory
+
+        self.channels = channels
+        self.max_hops = max_hops
+        self.parameters = [c.pitch_parameters for c in channels]
+
+        shape = (len(channels), max_hops, max(c.hop_size for c in channels))
+        itemsize = num.dtype(num.float32).itemsize
+        self.shm_in = shared_memory.SharedMemory(
+            create=True, size=int(num.prod(shape)) * itemsize
+        )
+        self.shm_out = shared_memory.SharedMemory(
+            create=True, size=shape[0] * shape[1] * 2 * itemsize
+        )
+        self.hops = num.ndarray(shape, dtype=num.float32, buffer=self.shm_in.buf)
+        self.out = num.ndarray(
+            shape[:2] + (2,), dtype=num.float32, buffer=self.shm_out.buf
+        )
+
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_run_pitch_shard,
+            args=(
+                child_conn,
+                self.shm_in.name,
+                self.shm_out.name,
+                shape,
+                self.parameters,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        self.nhops = None
+
+    def submit(self, hops, istart):
+        """Copy up to `max_hops` hops starting at *istart* from *hops*, a dict
+        mapping channel ids to (nhops, hop_size) arrays, and start
+        processing. Channels without hops in *hops*, e.g. channels estimated
+        with numpy yin, are skipped. Returns False if there is nothing to do
+        for this shard."""
+        self.nhops = []
+        for ic, c in enumerate(self.channels):
+            d = hops.get(id(c))
+            if d is None:
+                self.nhops.append(0)
+                continue
+
+            d = d[istart : istart + self.max_hops]
+            self.hops[ic, : len(d), : d.shape[1]] = d
+            self.nhops.append(len(d))
+
+        if not any(self.nhops):
+            return False
+
+        self.conn.send(self.nhops)
+        return True
+
+    def collect(self, results):
+        """Wait for the process and append pitches and confidences to
+        *results*."""
+        self.conn.recv()
+        for ic, c in enumerate(self.channels):
+            n = self.nhops[ic]
+            if n:
+                results[id(c)].append(self.out[ic, :n].copy())
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(None)
+            self.process.join()
+
+        del self.hops, self.out
+        for shm in (self.shm_in, self.shm_out):
+            shm.close()
+            shm.unlink()
+
+
+class PitchPool(object):
+    """Pitch estimation sharded across processes.
+
+    Channels are distributed round robin to *nprocesses* processes, each
+    keeping its own aubio pitch detectors. Pitch detection then scales with
+    the number of cores instead of being bound to a single thread."""
+
+    def __init__(self, channels, nprocesses=None, max_hops=64):
+        """
+        :param channels: list of `pytch.data.Channel` instances
+        :param nprocesses: number of processes. Defaults to the number of cpus
+        :param max_hops: hops per channel handed to a process at once"""
+        nprocesses = nprocesses or multiprocessing.cpu_count()
+        self.nprocesses = max(1, min(nprocesses, len(channels)))
+        self.channels = channels
+        self.max_hops = max_hops
+        self.shards = []
+
+        # forking a process running Qt threads is not safe
+        self.context = multiprocessing.get_context("spawn")
+        atexit.register(self.close)
+        self.setup()
+
+    def setup(self):
+        """(Re)start processes with the channels' current pitch parameters."""
+        self.close()
+        self.shards = [
+            PitchShard(self.channels[i :: self.nprocesses], self.max_hops, self.context)
+            for i in range(self.nprocesses)
+        ]
+        self.parameters = [c.pitch_parameters for c in self.channels]
+        logger.debug("started %i pitch processes" % self.nprocesses)
+
+    def process(self, channels, hops):
+        """Estimate pitch and confidence.
+
+        :param channels: list of `pytch.data.Channel` instances
+        :param hops: list of arrays of shape (nhops, hop_size) per channel
+        :returns: list of (pitch, confidence) tuples per channel"""
+        # restart if e.g. the pitch algorithm changed
+        if self.parameters != [c.pitch_parameters for c in self.channels]:
+            self.setup()
+
+        hops = {id(c): h for c, h in zip(channels, hops)}
+        results = {id(c): [] for c in channels}
+        nhops = max((len(h) for h in hops.values()), default=0)
+        for istart in range(0, nhops, self.max_hops):
+            busy = [shard for shard in self.shards if shard.submit(hops, istart)]
+            for shard in busy:
+                shard.collect(results)
+
+        estimates = []
+        for c in channels:
+            r = num.concatenate(results[id(c)]) if results[id(c)] else num.zeros((0, 2))
+            estimates.append((r[:, 0], r[:, 1]))
+
+        return estimates
+
+    def close(self):
+        """ Stop all processes. They are restarted on the next call to
+        `process`."""
+        for shard in self.shards:
+            shard.close()
+
+        self.shards = []
+        self.parameters = None
+
+
+def analyze_file(
+    fn,
+    outdir,
+    fftsize=1024,
+    hop_size=1024,
+    selected_channels=None,
+    pitch_algorithm=None,
+    pitch_processes=0,
+    save_spectra=False,
+):
+    """Run the spectrum and pitch analysis of the GUI on an audio file as fast
+    as possible.
+
+    Pitches in cents and confidences of all channels are written to the
+    pitch track file `pitch.ptrack` in *outdir* (see `pytch.pitch_track`).
+    If *save_spectra* is True, power spectra are written to
+    `spectrum_<i>.npy` per channel."""
+    provider = FileProvider(
+        fn, fftsize=fftsize, hop_size=hop_size, selected_channels=selected_channels
+    )
+    channels = provider.channels
+    if pitch_algorithm:
+        for c in channels:
+            c.pitch_algorithm = pitch_algorithm
+
+    worker = Worker(channels, provider=provider, pitch_processes=pitch_processes)
+
+    c0 = channels[0]
+    nframes = provider.nsamples // c0.hop_size
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    track = PitchTrackWriter.from_channels(
+        os.path.join(outdir, "pitch.ptrack"), channels
+    )
+    spectra = []
+    if save_spectra:
+        spectra = [
+            open_memmap(
+                os.path.join(outdir, "spectrum_%i.npy" % ic),
+                mode="w+",
+                dtype=num.uint32,
+                shape=(nframes, len(c.freqs)),
+            )
+            for ic, c in enumerate(channels)
+        ]
+
+    iframe = 0
+    while not provider.finished:
+        worker.update()
+
+        istop = c0.frame_index.i_filled
+        track.write_channels(channels, iframe, istop)
+        for spectrum, c in zip(spectra, channels):
+            spectrum[iframe:istop] = c.fft.frame_data(iframe, istop)
+
+        iframe = istop
+        logger.debug("analyzed %i of %i frames" % (iframe, nframes))
 
-            amp_spec = num.abs(num.fft.rfft(frame_work * win)) ** 2 / channel.fftsize
-            channel.fft.append(num.asarray(amp_spec, dtype=num.uint32))
+    if worker.pitch_pool is not None:
+        worker.pitch_pool.close()
 
-            channel.pitch_confidence.append_value(channel.pitch_o.get_confidence())
+    provider.terminate()
+    track.close()
+    for a in spectra:
+        a.flush()
 
-            channel.pitch.append_value(channel.pitch_o(frame_work)[0])
+    return nframes
 
 
 def cross_spectrum(spec1, spec2):
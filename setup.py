@@ -40,7 +40,7 @@ setup(
     author="Frank Scherbaum and Marius Kriegerowski",
     package_dir={"pytch": "src"},
     packages=["pytch"],
-    scripts=["apps/pytch"],
+    scripts=["apps/pytch", "apps/pytch-analyze"],
     install_requires=[
         "cython>=0.29",
         "numpy>=1.15.4",
@@ -2,6 +2,8 @@ import unittest
 
 from test_buffer import BufferTestCase
 from test_mic import MicTestCase
+from test_pitch_track import PitchTrackTestCase
+from test_processing import ProcessingTestCase
 from test_util import UtilTestCase
 
 if __name__ == "__main__":
@@ -1,6 +1,17 @@
+import gc
+import io
+import os
+import shutil
+import tempfile
 import numpy as num
 import unittest
-from pytch.data import Buffer, RingBuffer
+import weakref
+from scipy.io import wavfile
+from pytch.data import Buffer, RingBuffer, AudioRingBuffer
+from pytch.data import MultiChannelRingBuffer, MemmapBuffer, Channel, WavWriter
+from pytch.data import ReplayProvider, RingBuffer2D, SpectrogramPyramid
+from pytch.data import MinMaxEnvelope, SpectralAverage, log_frequency_matrix
+from pytch.data import max_resample, FileProvider, read_session, session_header_fn
 import time
 
 
@@ -70,7 +81,7 @@ class BufferTestCase(unittest.TestCase):
         num.testing.assert_equal(len(r.latest_frame_data(5)), 5)
         r.append(d)
         num.testing.assert_array_equal(
-            r.latest_frame_data(5), num.array([9.0, 0.0, 1.0, 2.0, 3.0])
+            r.latest_frame_data(5), num.array([0.0, 0.0, 1.0, 2.0, 3.0])
         )
 
         r.append(d)
@@ -126,6 +137,402 @@ class BufferTestCase(unittest.TestCase):
             num.asarray(x[:-1], num.float64), num.arange(90, 120) / sampling_rate
         )
 
+    def test_audio_ringbuffer(self):
+        r = AudioRingBuffer(nframes=8, nchannels=2)
+        d = num.arange(10, dtype=num.int16).reshape(5, 2)
+        self.assertTrue(r.write(d))
+        num.testing.assert_array_equal(r.read(), d)
+        self.assertEqual(r.nfilled, 0)
+
+        # wraps around the end of the ring
+        self.assertTrue(r.write(d))
+        self.assertFalse(r.write(d))
+        self.assertEqual(r.noverflow, 1)
+        num.testing.assert_array_equal(r.read(), d)
+        self.assertEqual(len(r.read()), 0)
+
+        # overflows keep counting, the consumer never resets them
+        self.assertFalse(r.write(num.zeros((9, 2), dtype=num.int16)))
+        self.assertEqual(r.noverflow, 2)
+
+    def test_multichannel_ringbuffer(self):
+        r = MultiChannelRingBuffer(2, sampling_rate=1, buffer_length_seconds=5)
+        channels = [Channel(1, fftsize=4, buffer=r, ichannel=i) for i in range(2)]
+        d = num.vstack((num.arange(4), num.arange(4) * 10))
+        r.append(d)
+        r.append(d)
+        self.assertEqual(r.latest_frame_data(3).shape, (2, 3))
+        num.testing.assert_array_equal(
+            channels[0].latest_frame_data(3), num.array([1.0, 2.0, 3.0])
+        )
+        num.testing.assert_array_equal(
+            channels[1].latest_frame_data(3), num.array([10.0, 20.0, 30.0])
+        )
+        self.assertEqual(channels[1].i_filled, 8)
+
+    def test_ringbuffer_latest_frame_is_view(self):
+        r = RingBuffer(1, 10)
+        for i in range(4):
+            r.append(num.arange(i * 4, (i + 1) * 4))
+
+        frame = r.latest_frame_data(10)
+        num.testing.assert_array_equal(frame, num.arange(6, 16))
+        self.assertTrue(frame.flags.c_contiguous)
+        self.assertFalse(frame.flags.writeable)
+        self.assertTrue(num.shares_memory(frame, r._data_mirrored))
+
+    def test_ringbuffer2d(self):
+        r = RingBuffer2D(ndimension2=2, sampling_rate=1, buffer_length_seconds=5)
+        self.assertEqual(r.data.shape, (5, 2))
+        d = num.arange(24).reshape(12, 2)
+        for n in [3, 1, 4]:
+            r.append(d[r.i_filled : r.i_filled + n])
+
+        num.testing.assert_array_equal(r.latest_frame_data(5), d[3:8])
+        num.testing.assert_array_equal(r.frame_data(5, 8), d[5:8])
+        self.assertTrue(num.shares_memory(r.frame_data(5, 8), r.data))
+
+        r.append_value(d[8])
+        r.append(d[:12])
+        self.assertEqual(r.i_filled, 21)
+        num.testing.assert_array_equal(r.latest_frame_data(5), d[7:12])
+
+    def test_memmap_buffer(self):
+        fd, fn = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            b = MemmapBuffer(fn, 2, sampling_rate=10, segment_length_seconds=1)
+            channels = [Channel(10, fftsize=4, buffer=b, ichannel=i) for i in range(2)]
+            d = num.vstack((num.arange(25), -num.arange(25)))
+            b.append(d[:, :7])
+            b.append(d[:, 7:])
+            self.assertEqual(b.capacity, 30)
+            self.assertEqual(channels[1].data_len, 30)
+
+            num.testing.assert_array_equal(
+                channels[1].latest_frame_data(3), [-22.0, -23.0, -24.0]
+            )
+            num.testing.assert_array_equal(
+                b.frame_data(-2, 2), [[0.0, 0.0, 0.0, 1.0], [0.0, 0.0, 0.0, -1.0]]
+            )
+            num.testing.assert_array_equal(channels[0].ydata, num.arange(25))
+            num.testing.assert_allclose(channels[0].xdata, num.arange(25) / 10.0)
+
+            tmpdir = tempfile.mkdtemp()
+            try:
+                fn_save = os.path.join(tmpdir, "channel")
+                channels[1].save_as(fn_save, fmt="txt")
+                saved = num.loadtxt(fn_save + ".txt")
+                num.testing.assert_allclose(saved[:, 0], num.arange(25) / 10.0)
+                num.testing.assert_array_equal(saved[:, 1], -num.arange(25))
+
+                channels[1].save_as(fn_save, fmt="wav")
+                sampling_rate, saved = wavfile.read(fn_save + ".wav")
+                self.assertEqual(sampling_rate, 10)
+                num.testing.assert_array_equal(saved, -num.arange(25))
+            finally:
+                shutil.rmtree(tmpdir)
+
+            b.close()
+            self.assertEqual(os.path.getsize(fn), 25 * 2 * 4)
+            recorded = num.fromfile(fn, dtype=num.float32).reshape(-1, 2)
+            num.testing.assert_array_equal(recorded.T, d)
+
+            # closed buffers are not kept alive until exit
+            ref = weakref.ref(b)
+            del b, channels
+            gc.collect()
+            self.assertIsNone(ref())
+        finally:
+            os.remove(fn)
+            os.remove(session_header_fn(fn))
+
+    def test_session(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tempdir, "session.f32")
+            b = MemmapBuffer(
+                fn, 2, sampling_rate=8000, segment_length_seconds=1, channels=[1, 3]
+            )
+            d = num.vstack((num.arange(20000), -num.arange(20000)))
+            b.append(num.asarray(d % 3000, dtype=num.float32))
+            b.close()
+
+            header, data = read_session(fn)
+            self.assertEqual(
+                header,
+                dict(sampling_rate=8000, nchannels=2, dtype="<f4", channels=[1, 3]),
+            )
+            num.testing.assert_array_equal(data.T, d % 3000)
+
+            # sessions are replayed and analyzed like audio files
+            p = FileProvider(fn, fftsize=256, hop_size=256)
+            self.assertEqual(p.sampling_rate, 8000)
+            self.assertEqual(p.nsamples, 20000)
+            while not p.finished:
+                p.flush()
+
+            num.testing.assert_array_equal(
+                p.channels[1].latest_frame_data(20000), d[1] % 3000
+            )
+            p.terminate()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_wav_writer(self):
+        fd, fn = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            d = num.arange(3000, dtype=num.int16).reshape(-1, 3)
+            w = WavWriter(fn, 3, 8000, selected_channels=[0, 2], header_interval=0.01)
+            for i in range(0, len(d), 100):
+                w.write(d[i : i + 100].tobytes())
+            w.close()
+
+            sampling_rate, recorded = wavfile.read(fn)
+            self.assertEqual(sampling_rate, 8000)
+            num.testing.assert_array_equal(recorded, d[:, [0, 2]])
+        finally:
+            os.remove(fn)
+
+        # switch to RF64 beyond 4 GB
+        w.nbytes = 2 ** 32
+        f = io.BytesIO()
+        w.write_header(f)
+        header = f.getvalue()
+        self.assertEqual(len(header), WavWriter.header_size)
+        self.assertEqual(header[:4], b"RF64")
+        self.assertEqual(header[12:16], b"ds64")
+
+    def test_minmax_envelope(self):
+        e = MinMaxEnvelope(2, 100, 100, bucket_size=4, factor=2, nlevels=3)
+        self.assertEqual(e.bucket_sizes, [4, 8, 16])
+        self.assertEqual([l.data_len for l in e.levels], [2500, 1250, 625])
+
+        d = num.random.normal(size=(2, 1000)).astype(num.float32)
+        i = 0
+        for n in [1, 3, 5, 100, 891]:
+            e.append(d[:, i : i + n])
+            i += n
+
+        self.assertEqual(e.select_level(1000, 250), 0)
+        self.assertEqual(e.select_level(1000, 100), 1)
+        self.assertEqual(e.select_level(1000, 10), 2)
+
+        # last 8 samples of the 1000 are not a complete 16 sample bucket
+        istart, mins, maxs = e.latest(320, 10)
+        num.testing.assert_array_equal(istart, num.arange(672, 992, 16))
+        buckets = d[:, 672:992].reshape(2, 20, 16)
+        num.testing.assert_array_equal(mins, buckets.min(axis=2))
+        num.testing.assert_array_equal(maxs, buckets.max(axis=2))
+
+        b = MultiChannelRingBuffer(2, sampling_rate=100, buffer_length_seconds=10)
+        b.append(d)
+        c = Channel(100, fftsize=64, hop_size=16, buffer=b, ichannel=1)
+        x, y = c.latest_envelope(1.0, 50)
+        self.assertEqual(len(x), 2 * 12)
+        num.testing.assert_allclose(x[::2], num.arange(904, 1000, 8) / 100.0)
+        buckets = d[1, 904:1000].reshape(12, 8)
+        num.testing.assert_array_equal(y[::2], buckets.min(axis=1))
+        num.testing.assert_array_equal(y[1::2], buckets.max(axis=1))
+
+    def test_spectrogram_pyramid(self):
+        base = RingBuffer2D(
+            ndimension2=9, sampling_rate=10, buffer_length_seconds=10, dtype=num.uint32
+        )
+        p = SpectrogramPyramid(base, nlevels=3, time_factor=4, freq_factor=2)
+        self.assertEqual(len(p.levels), 1)
+
+        # coarser levels are allocated on request
+        num.testing.assert_array_equal(p.latest_image(320, 9, (20, 3)), 0)
+        p.append(base.data[:0])
+        self.assertEqual([l.ndimension2 for l in p.levels], [9, 5, 3])
+        self.assertEqual([l.data_len for l in p.levels], [100, 100, 100])
+
+        d = num.random.randint(0, 1000, size=(4 * 4 * 20, 9)).astype(num.uint32)
+        i = 0
+        for n in [1, 3, 7, 30, 279]:
+            base.append(d[i : i + n])
+            p.append(d[i : i + n])
+            i += n
+
+        level1 = num.maximum.reduceat(
+            d.reshape(-1, 4, 9).max(axis=1), [0, 2, 4, 6, 8], axis=1
+        )
+        num.testing.assert_array_equal(p.levels[1].latest_frame_data(80), level1)
+        level2 = num.maximum.reduceat(
+            level1.reshape(-1, 4, 5).max(axis=1), [0, 2, 4], axis=1
+        )
+        num.testing.assert_array_equal(p.levels[2].latest_frame_data(20), level2)
+
+        self.assertEqual(p.select_level(100, 100), 0)
+        self.assertEqual(p.select_level(320, 20), 2)
+        self.assertEqual(p.select_level(10000, 20), 2)
+
+        num.testing.assert_array_equal(
+            p.latest_image(320, 9, (20, 3)), level2.reshape(20, 3)
+        )
+
+        # only 320 of 640 frames are available
+        image = p.latest_image(640, 9, (10, 3))
+        num.testing.assert_array_equal(image[:5], 0)
+        num.testing.assert_array_equal(image[5:], level2.reshape(5, 4, 3).max(axis=1))
+
+        # levels requested later start with the history of the level below
+        base = RingBuffer2D(
+            ndimension2=9, sampling_rate=10, buffer_length_seconds=10, dtype=num.uint32
+        )
+        p = SpectrogramPyramid(base, nlevels=3, time_factor=4, freq_factor=2)
+        base.append(d[:310])
+        p.append(d[:310])
+        image = p.latest_image(320, 9, (20, 3))
+        self.assertEqual(len(p.levels), 1)
+        num.testing.assert_array_equal(image[:14], 0)
+        num.testing.assert_array_equal(image[14:], max_resample(d[210:310], (6, 3)))
+
+        base.append(d[310:])
+        p.append(d[310:])
+        self.assertEqual([l.i_filled for l in p.levels], [320, 80, 20])
+        self.assertEqual(p.ifirst, [0, 55, 14])
+        num.testing.assert_array_equal(p.levels[1].latest_frame_data(25), level1[55:])
+        num.testing.assert_array_equal(p.levels[2].latest_frame_data(6), level2[14:])
+        image = p.latest_image(320, 9, (20, 3))
+        num.testing.assert_array_equal(image[:14], 0)
+        num.testing.assert_array_equal(image[14:], level2[14:])
+
+    def test_spectral_average(self):
+        b = RingBuffer2D(
+            ndimension2=3, sampling_rate=10, buffer_length_seconds=2, dtype=num.uint32
+        )
+        average = SpectralAverage(b, n=5)
+        d = num.random.randint(0, 2 ** 32, size=(100, 3), dtype=num.uint32)
+        i = 0
+        for n in [1, 2, 7, 3, 1, 30, 1, 2, 19, 10, 24]:
+            b.append(d[i : i + n])
+            average.append(d[i : i + n])
+            i += n
+            expected = num.sum(b.latest_frame_data(5), axis=0, dtype=num.int64)
+            num.testing.assert_array_equal(average.state, expected)
+
+        num.testing.assert_allclose(average.mean(), d[i - 5 : i].mean(axis=0))
+
+        # windows are limited to the spectra held by the buffer
+        average.set_length(30)
+        self.assertEqual(average.n, 20)
+        b.append(d[:1])
+        average.append(d[:1])
+        num.testing.assert_allclose(
+            average.mean(), num.mean(b.latest_frame_data(20), axis=0)
+        )
+
+        average.set_length(4, mode="ema")
+        a = 1.0 - num.exp(-1.0 / 4)
+        ema = average.mean().copy()
+        for n in [1, 3, 2]:
+            b.append(d[:n])
+            average.append(d[:n])
+            for frame in d[:n]:
+                ema = (1.0 - a) * ema + a * frame
+        num.testing.assert_allclose(average.mean(), ema)
+
+    def test_spectrum_buffer_size(self):
+        # smallest hop size and largest FFT size offered by the GUI
+        c = Channel(48000, fftsize=16384, hop_size=256)
+        nhistory = int(c.spectrogram_history_seconds * c.fft.sampling_rate)
+        for pyramid in (c.fft_pyramid, c.log_fft_pyramid):
+            pyramid.latest_image(nhistory, 100, (100, 100))
+            pyramid.append(pyramid.levels[0].data[:0])
+            self.assertEqual(len(pyramid.levels), pyramid.nlevels)
+
+            # the coarsest level covers the longest history
+            top = pyramid.levels[-1]
+            self.assertGreaterEqual(
+                top.data_len / top.sampling_rate, c.spectrogram_history_seconds
+            )
+
+        # 5 s spectral averages fit, but not the whole sample history
+        self.assertGreaterEqual(c.fft.data_len, 5 * c.fft.sampling_rate)
+        self.assertLess(c.fft.data_len, c.buffer_length_seconds * c.fft.sampling_rate)
+
+        nbytes = sum(
+            level.data.nbytes
+            for pyramid in (c.fft_pyramid, c.log_fft_pyramid)
+            for level in pyramid.levels
+        )
+        self.assertLess(nbytes, 100 * 2 ** 20)
+
+    def test_log_frequency_matrix(self):
+        freqs = num.arange(0.0, 1000.0, 10.0)
+        centers, m = log_frequency_matrix(
+            freqs, 440.0, fmin=100.0, nbins=30, bins_per_semitone=1
+        )
+        self.assertEqual(m.shape, (30, 100))
+        num.testing.assert_allclose(centers[0], 440.0 * 2 ** (-25 / 12.0))
+        num.testing.assert_allclose(centers[25], 440.0)
+        num.testing.assert_allclose(m.sum(axis=1), 1.0)
+
+        # a wide bin averages its FFT bins, a narrow one is interpolated
+        spectrum = freqs ** 2
+        log_spectrum = m.dot(spectrum)
+        edges = 440.0 * 2 ** (num.array([-0.5, 0.5]) / 12.0)
+        inside = (freqs >= edges[0]) & (freqs < edges[1])
+        num.testing.assert_allclose(log_spectrum[25], spectrum[inside].mean())
+        self.assertEqual(num.diff(m[0].indices), 1)
+        num.testing.assert_allclose(
+            log_spectrum[0], num.interp(centers[0], freqs, spectrum)
+        )
+
+        channel = Channel(8000, fftsize=1024, hop_size=256)
+        self.assertEqual(len(channel.log_freqs), channel.log_nbins)
+        # bins follow the standard frequency shifted by an eighth tone
+        channel.standard_frequency = 440.0 * 2 ** (1 / 48.0)
+        num.testing.assert_allclose(
+            channel.log_freqs[:2], 55.0 * 2 ** (num.array([1, 3]) / 48.0)
+        )
+
+    def test_replay_provider(self):
+        fd, fn = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            d = (num.arange(8000 * 8 * 2) % 30000).astype(num.int16).reshape(-1, 2)
+            wavfile.write(fn, 8000, d)
+
+            p = ReplayProvider(fn, fftsize=256, hop_size=256, speed=4.0)
+            self.assertEqual(p.duration, 8.0)
+            c = p.channels[1]
+
+            p.start()
+            time.sleep(0.25)
+            p.stop()
+            p.flush()
+            n = p.i_read
+            self.assertGreater(n, 6000)
+            self.assertLess(n, 12000)
+            num.testing.assert_array_equal(c.latest_frame_data(n), d[:n, 1])
+
+            # paused
+            time.sleep(0.1)
+            p.flush()
+            self.assertEqual(p.i_read, n)
+
+            p.seek(6.0)
+            p.start()
+            time.sleep(0.1)
+            p.flush()
+            nseek = p.i_read - 6 * 8000
+            self.assertGreater(nseek, 0)
+            num.testing.assert_array_equal(
+                c.latest_frame_data(nseek), d[6 * 8000 : p.i_read, 1]
+            )
+
+            # replay ends at the end of the file
+            time.sleep(0.6)
+            p.flush()
+            self.assertTrue(p.finished)
+            p.terminate()
+        finally:
+            os.remove(fn)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import numpy as num
+import unittest
+from pytch.pitch_track import PitchTrack, PitchTrackWriter
+from pytch.util import f2cent
+
+
+class PitchTrackTestCase(unittest.TestCase):
+    def test_write_read(self):
+        fd, fn = tempfile.mkstemp(suffix=".ptrack")
+        os.close(fd)
+        try:
+            writer = PitchTrackWriter(
+                fn, 2, standard_frequency=[220.0, 440.0], names=["a", "b"]
+            )
+            time = num.arange(1000) * 0.1
+            pitch = num.vstack((time, -time)).T
+            for i in range(0, 1000, 300):
+                writer.write(time[i : i + 300], pitch[i : i + 300], 0.5)
+
+            # incomplete record of a file which is still written to
+            writer.file.write(b"\x00" * 10)
+            writer.close()
+
+            track = PitchTrack(fn)
+            self.assertEqual(len(track), 1000)
+            self.assertEqual(track.names, ["a", "b"])
+            num.testing.assert_array_equal(track.time, time)
+            num.testing.assert_allclose(track.pitch, pitch, rtol=1e-6)
+
+            t, p, c = track.query(10.0, 20.0)
+            num.testing.assert_array_equal(t, time[100:200])
+            num.testing.assert_allclose(p, pitch[100:200], rtol=1e-6)
+            num.testing.assert_array_equal(c, 0.5)
+
+            num.testing.assert_allclose(
+                track.to_frequency(f2cent(num.array([[330.0, 330.0]]), [220.0, 440.0])),
+                [[330.0, 330.0]],
+            )
+            del track, t, p, c
+        finally:
+            os.remove(fn)
+
+
+if __name__ == "__main__":
+    unittest.main()
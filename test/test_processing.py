@@ -0,0 +1,275 @@
+import os
+import shutil
+import tempfile
+import numpy as num
+import unittest
+from scipy.io import wavfile
+from pytch.data import Channel, MultiChannelRingBuffer, DataProvider, NUMPY_YIN
+from pytch.processing import Worker, yin, analyze_file
+from pytch.pitch_track import PitchTrack
+
+
+class ProcessingTestCase(unittest.TestCase):
+    def test_process_hops(self):
+        sampling_rate = 8000
+        channel = Channel(sampling_rate, fftsize=1024, hop_size=256)
+        worker = Worker([channel])
+
+        t = num.arange(sampling_rate) / sampling_rate
+        d = num.asarray(num.sin(2 * num.pi * 220.0 * t) * 1000.0, dtype=num.float32)
+
+        # frames are computed per hop, independent of the chunks appended
+        channel.append(d[:1000])
+        worker.process()
+        self.assertEqual(channel.fft.i_filled, 3)
+        channel.append(d[1000:])
+        worker.process()
+        self.assertEqual(channel.fft.i_filled, sampling_rate // 256)
+        self.assertEqual(channel.pitch.i_filled, sampling_rate // 256)
+        num.testing.assert_array_equal(
+            channel.frame_index.latest_frame_data(2), [7680, 7936]
+        )
+
+        f_peak = channel.freqs[num.argmax(channel.fft.latest_frame_data(1)[0])]
+        self.assertAlmostEqual(f_peak, 220.0, delta=sampling_rate / 1024)
+
+        num.testing.assert_allclose(
+            channel.fft_average.mean(),
+            num.mean(channel.fft.latest_frame_data(4), axis=0),
+        )
+
+        self.assertEqual(channel.log_fft.i_filled, sampling_rate // 256)
+        log_spectrum = channel.log_fft.latest_frame_data(1)[0]
+        f_peak = channel.log_freqs[num.argmax(log_spectrum)]
+        self.assertAlmostEqual(f_peak, 220.0, delta=sampling_rate / 1024)
+
+    def test_publish(self):
+        sampling_rate = 8000
+        channel = Channel(sampling_rate, fftsize=1024, hop_size=256)
+        worker = Worker([channel])
+
+        t = num.arange(sampling_rate) / sampling_rate
+        d = num.asarray(num.sin(2 * num.pi * 220.0 * t) * 1000.0, dtype=num.float32)
+        channel.append(d[:1000])
+        worker.update()
+        self.assertEqual(worker.version, 1)
+        self.assertEqual(channel.fft.i_published, 3)
+        published = channel.fft.latest_frame_data(3, published=True).copy()
+        mean = channel.fft_average.mean(published=True)
+
+        # processed but not yet published results stay invisible to views
+        channel.append(d[1000:])
+        worker.process()
+        self.assertEqual(channel.fft.i_published, 3)
+        num.testing.assert_array_equal(
+            channel.fft.latest_frame_data(3, published=True), published
+        )
+        num.testing.assert_array_equal(channel.fft_average.mean(published=True), mean)
+        x, y = channel.pitch.latest_frame(1.0, clip_min=True, published=True)
+        self.assertEqual(len(x), 3)
+
+        worker.update()
+        self.assertEqual(worker.version, 1)
+        channel.append(d[:256])
+        worker.update()
+        self.assertEqual(worker.version, 2)
+        self.assertEqual(channel.fft.i_published, channel.fft.i_filled)
+        self.assertEqual(channel.i_published, channel.i_filled)
+
+        mean = channel.fft_average.mean(published=True)
+        worker.on_spectrum_average_select(channel, 8, "ema")
+        self.assertEqual(channel.fft_average.n, 8)
+        self.assertEqual(channel.fft_average.mode, "ema")
+        num.testing.assert_array_equal(channel.fft_average.mean(published=True), mean)
+
+    def test_process_batched(self):
+        sampling_rate = 8000
+        buffer = MultiChannelRingBuffer(2, sampling_rate, Channel.buffer_length_seconds)
+        channels = [
+            Channel(sampling_rate, 1024, 256, buffer=buffer, ichannel=i)
+            for i in range(2)
+        ]
+        single = Channel(sampling_rate, 1024, 256)
+
+        worker = Worker(channels)
+        worker.max_batch_size = 4 * 1024
+        worker_single = Worker([single])
+
+        t = num.arange(sampling_rate) / sampling_rate
+        d = num.asarray(num.sin(2 * num.pi * 330.0 * t) * 1000.0, dtype=num.float32)
+        buffer.append(num.vstack((d, d * 0.5)))
+        single.append(d)
+        worker.process()
+        worker_single.process()
+
+        n = sampling_rate // 256
+        for channel in channels:
+            self.assertEqual(channel.fft.i_filled, n)
+            self.assertEqual(channel.i_processed, n * 256)
+
+        # all per hop results share one write index
+        analysis = channels[0].analysis
+        self.assertIs(channels[1].analysis, analysis)
+        self.assertEqual(analysis.fft.data.shape[:2], (2, analysis.fft.data_len))
+        self.assertEqual([b.i_filled for b in analysis.buffers], [n] * 6)
+        num.testing.assert_array_equal(
+            channels[1].pitch_confidence.latest_frame_data(n),
+            analysis.pitch_confidence.latest_frame_data(n)[1],
+        )
+        num.testing.assert_array_equal(
+            channels[0].fft.latest_frame_data(n), single.fft.latest_frame_data(n)
+        )
+        num.testing.assert_array_equal(
+            channels[0].frame_index.latest_frame_data(n),
+            single.frame_index.latest_frame_data(n),
+        )
+        num.testing.assert_allclose(
+            channels[1].pitch.latest_frame_data(n)[-5:],
+            single.pitch.latest_frame_data(n)[-5:],
+            rtol=1e-3,
+        )
+
+    def test_worker_version(self):
+        class Provider(DataProvider):
+            def __init__(self):
+                DataProvider.__init__(self)
+                self.channels = [Channel(8000, fftsize=1024, hop_size=256)]
+                self.pending = num.zeros(800, dtype=num.float32)
+
+            def flush(self):
+                self.channels[0].append(self.pending)
+                self.pending = num.zeros(0, dtype=num.float32)
+
+        provider = Provider()
+        worker = Worker(provider.channels, provider=provider)
+        versions = []
+        worker.processingFinished.connect(versions.append)
+
+        worker.update()
+        self.assertEqual(worker.version, 1)
+        self.assertEqual(provider.channels[0].fft.i_filled, 3)
+
+        # nothing new arrived: no new version
+        worker.update()
+        self.assertEqual(worker.version, 1)
+        self.assertEqual(versions, [1])
+
+    def test_pitch_pool(self):
+        sampling_rate = 8000
+        t = num.arange(sampling_rate) / sampling_rate
+        d = num.vstack(
+            [num.sin(2 * num.pi * f * t) * 1000.0 for f in (220.0, 330.0, 440.0)]
+        ).astype(num.float32)
+
+        pitches = []
+        for pitch_processes in (0, 2):
+            buffer = MultiChannelRingBuffer(3, sampling_rate, 40)
+            channels = [
+                Channel(sampling_rate, 1024, 256, buffer=buffer, ichannel=i)
+                for i in range(3)
+            ]
+            worker = Worker(channels, pitch_processes=pitch_processes)
+            worker.max_batch_size = 3 * 1024 * 20
+            buffer.append(d)
+            worker.process()
+            if worker.pitch_pool is not None:
+                self.assertEqual(len(worker.pitch_pool.shards), 2)
+                worker.pitch_pool.close()
+
+            pitches.append([c.pitch.latest_frame_data(31) for c in channels])
+
+        num.testing.assert_allclose(pitches[0], pitches[1])
+
+    def test_pitch_pool_mixed(self):
+        sampling_rate = 8000
+        t = num.arange(sampling_rate) / sampling_rate
+        d = num.vstack(
+            [num.sin(2 * num.pi * f * t) * 1000.0 for f in (220.0, 330.0, 440.0)]
+        ).astype(num.float32)
+
+        buffer = MultiChannelRingBuffer(3, sampling_rate, 40)
+        channels = [
+            Channel(sampling_rate, 1024, 256, buffer=buffer, ichannel=i)
+            for i in range(3)
+        ]
+        channels[1].pitch_algorithm = NUMPY_YIN
+        worker = Worker(channels, pitch_processes=2)
+        try:
+            # nothing arrived yet: an empty batch of hops
+            self.assertEqual(worker.process(), 0)
+            hops = num.zeros((0, 256), dtype=num.float32)
+            estimates = worker.pitch_pool.process([channels[0]], [hops])
+            self.assertEqual(len(estimates[0][0]), 0)
+
+            buffer.append(d)
+            worker.process()
+        finally:
+            worker.pitch_pool.close()
+
+        for c, f in zip(channels, (220.0, 330.0, 440.0)):
+            self.assertEqual(c.pitch.i_filled, sampling_rate // 256)
+            self.assertAlmostEqual(
+                c.undo_pitch_proxy(c.get_latest_pitch())[0], f, delta=5.0
+            )
+
+    def test_yin(self):
+        sampling_rate = 8000
+        t = num.arange(2048) / sampling_rate
+        frames = []
+        for f in (110.0, 220.0, 330.0):
+            frames.append(
+                num.sin(2 * num.pi * f * t) + 0.5 * num.sin(2 * num.pi * 2 * f * t)
+            )
+
+        frames = num.reshape(frames, (3, 2, 1024))
+        pitch, confidence = yin(frames, sampling_rate)
+        self.assertEqual(pitch.shape, (3, 2))
+        num.testing.assert_allclose(pitch[:, 0], [110.0, 220.0, 330.0], rtol=2e-3)
+        self.assertTrue(num.all(confidence > 0.99))
+
+        pitch, confidence = yin(num.zeros((4, 1024)), sampling_rate)
+        num.testing.assert_array_equal(confidence, 0.0)
+
+    def test_process_numpy_yin(self):
+        sampling_rate = 8000
+        channel = Channel(sampling_rate, fftsize=1024, hop_size=256)
+        channel.pitch_algorithm = NUMPY_YIN
+        self.assertIsNone(channel.pitch_o)
+
+        t = num.arange(sampling_rate) / sampling_rate
+        channel.append(num.sin(2 * num.pi * 220.0 * t).astype(num.float32))
+        Worker([channel]).process()
+        self.assertEqual(channel.pitch.i_filled, sampling_rate // 256)
+        self.assertTrue(num.all(channel.pitch_confidence.latest_frame_data(10) > 0.9))
+
+    def test_analyze_file(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            sampling_rate = 8000
+            t = num.arange(sampling_rate * 50) / sampling_rate
+            d = num.vstack(
+                (num.sin(2 * num.pi * 220.0 * t), num.sin(2 * num.pi * 330.0 * t))
+            )
+            fn = os.path.join(tempdir, "test.wav")
+            wavfile.write(fn, sampling_rate, num.asarray(d.T * 1000, dtype=num.int16))
+
+            outdir = os.path.join(tempdir, "out")
+            nframes = analyze_file(
+                fn, outdir, fftsize=1024, hop_size=512, save_spectra=True
+            )
+            self.assertEqual(nframes, len(t) // 512)
+
+            track = PitchTrack(os.path.join(outdir, "pitch.ptrack"))
+            spectrum = num.load(os.path.join(outdir, "spectrum_1.npy"))
+            num.testing.assert_allclose(track.time[:2], [512 / 8000.0, 1024 / 8000.0])
+            self.assertEqual(track.pitch.shape, (nframes, 2))
+            self.assertEqual(spectrum.shape, (nframes, 513))
+            num.testing.assert_allclose(
+                track.to_frequency(track.pitch[-1]), [220.0, 330.0], rtol=1e-3
+            )
+        finally:
+            shutil.rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,13 @@
+import sys
 import numpy as num
 import unittest
+from PyQt5.QtWidgets import QApplication
+from PyQt5 import QtGui as qg
 from pytch.util import consecutive, f2cent, cent2f
+from pytch.gui_util import m4_decimation, QPolygonFPool, Projection
+from pytch.gui_util import max_pooling_table
+from pytch.plot import project_scene_items, Polyline, AxHLine, AxVLine
+from pytch.plot import ScrollingColormesh
 import time
 
 
@@ -20,6 +27,161 @@ class UtilTestCase(unittest.TestCase):
             fs, cent2f(ps, standard_frequency=standard_frequency)
         )
 
+    def test_m4_decimation(self):
+        x = num.arange(1000, dtype=float)
+        y = num.random.normal(size=1000)
+        xd, yd = m4_decimation(x, y, 0.0, 1000.0, 50)
+        self.assertEqual(len(xd), 4 * 50)
+        self.assertTrue(num.all(num.diff(xd) >= 0))
+
+        for icolumn in range(50):
+            column = slice(icolumn * 20, (icolumn + 1) * 20)
+            points = slice(icolumn * 4, (icolumn + 1) * 4)
+            xc, yc = xd[points], yd[points]
+            self.assertEqual(xc[0], x[column][0])
+            self.assertEqual(xc[-1], x[column][-1])
+            self.assertEqual(yc.min(), y[column].min())
+            self.assertEqual(yc.max(), y[column].max())
+
+        # points outside of the visible range end up in the outer columns
+        xd, yd = m4_decimation(x, y, 200.0, 400.0, 10)
+        self.assertEqual(len(xd), 4 * 10)
+        self.assertEqual(xd[0], 0.0)
+        self.assertEqual(xd[-1], x[-1])
+
+    def test_max_pooling_table(self):
+        x = num.arange(100.0)
+        y = num.random.random(100)
+        istart, istop, offsets, xpooled = max_pooling_table(x, 10.0, 50.0, 10)
+        self.assertEqual((istart, istop), (10, 51))
+        num.testing.assert_array_equal(offsets, num.arange(0, 44, 4))
+        num.testing.assert_allclose(xpooled[:2], [11.5, 15.5])
+        num.testing.assert_allclose(xpooled[-1], 50.0)
+        num.testing.assert_array_equal(
+            num.maximum.reduceat(y[istart:istop], offsets)[:-1],
+            y[10:50].reshape(10, 4).max(axis=1),
+        )
+
+        # fewer samples than pixels, pixels without samples are skipped
+        istart, istop, offsets, xpooled = max_pooling_table(x, 0.0, 9.0, 100)
+        num.testing.assert_array_equal(offsets, num.arange(10))
+        num.testing.assert_allclose(xpooled, x[:10])
+
+        # equally wide pixels on a log axis pool more samples at the top
+        istart, istop, offsets, xpooled = max_pooling_table(x, 0.0, 99.0, 10, log=True)
+        self.assertEqual(istart, 1)
+        self.assertTrue(num.all(num.diff(num.diff(offsets)) >= 0))
+        self.assertEqual(max_pooling_table(x, 200.0, 300.0, 10)[2].size, 0)
+
+    def test_polygon_pool(self):
+        xproj = Projection()
+        xproj.set_out_range(0.0, 100.0)
+        yproj = Projection()
+        yproj.set_out_range(0.0, 10.0, flip=True)
+        pool = QPolygonFPool()
+
+        for n in [100, 30, 30, 200]:
+            pool.reset()
+            x = num.random.random(n)
+            y = num.random.random(n)
+            p1 = pool.make_QPolygonF(x, y, xproj, yproj)
+            p2 = pool.make_QPolygonF(y, x, xproj, yproj)
+            self.assertEqual(p1.size(), n)
+            self.assertEqual(len(pool.polygons), 2)
+            self.assertAlmostEqual(p1.at(n - 1).x(), x[-1] * 100.0)
+            self.assertAlmostEqual(p1.at(n - 1).y(), 10.0 - y[-1] * 10.0)
+            self.assertAlmostEqual(p2.at(0).x(), y[0] * 100.0)
+
+    def test_project_scene_items(self):
+        xproj = Projection()
+        xproj.set_out_range(0.0, 100.0)
+        yproj = Projection()
+        yproj.set_out_range(0.0, 10.0, flip=True)
+
+        x = num.random.random(50)
+        y = num.random.random(50)
+        items = [
+            AxHLine(y=0.5, pen=None),
+            Polyline(x=x, y=y, pen=None),
+            AxVLine(x=0.25, pen=None),
+            Polyline(x=x[:3], y=num.arange(3), pen=None),
+        ]
+        pool = QPolygonFPool()
+        project_scene_items(items, xproj, yproj, pool)
+
+        self.assertIsNone(items[0].projected[0])
+        num.testing.assert_allclose(items[0].projected[1], [5.0])
+        self.assertIsNone(items[2].projected[1])
+        num.testing.assert_allclose(items[2].projected[0], [25.0])
+
+        self.assertEqual(len(pool.polygons), 2)
+        self.assertEqual(items[1].qpoints.size(), 50)
+        self.assertAlmostEqual(items[1].qpoints.at(7).x(), x[7] * 100.0)
+        self.assertAlmostEqual(items[1].qpoints.at(7).y(), 10.0 - y[7] * 10.0)
+        self.assertAlmostEqual(items[3].qpoints.at(2).y(), -10.0)
+
+        # only the changed item is projected again and keeps its polygon
+        polygon = items[3].qpoints
+        items[3].set_data(x[:5], num.zeros(5))
+        self.assertTrue(items[3].dirty)
+        project_scene_items([items[3]], xproj, yproj, pool, reset_pool=False)
+        self.assertFalse(items[3].dirty)
+        self.assertIs(items[3].qpoints, polygon)
+        self.assertEqual(polygon.size(), 5)
+        self.assertAlmostEqual(polygon.at(4).y(), 10.0)
+        self.assertEqual(items[1].qpoints.size(), 50)
+        self.assertEqual(len(pool.polygons), 2)
+
+        # nans split a line into segments
+        self.assertIsNone(items[3].segments)
+        items[3].set_data(x[:7], [0.0, num.nan, 1.0, 2.0, num.nan, num.nan, 3.0])
+        project_scene_items([items[3]], xproj, yproj, pool, reset_pool=False)
+        self.assertEqual(items[3].segments, [(0, 1), (2, 2), (6, 1)])
+
+    def test_scrolling_colormesh(self):
+        app = QApplication.instance() or QApplication(sys.argv)  # noqa
+        nframes, nbins = 4, 3
+        frames = num.arange(6 * nbins).reshape(6, nbins)
+        for vertical in (False, True):
+            mesh = ScrollingColormesh(nframes, nbins, vertical=vertical)
+            mesh.vmax = 1.0
+
+            mesh.append_frames(frames[:3])
+            self.assertEqual(mesh.iframe, 3)
+            self.assertEqual(mesh.pending, [(0, 3)])
+            mesh.pending = []
+
+            mesh.append_frames(frames[3:5])
+            self.assertEqual(mesh.iframe, 1)
+            self.assertEqual(mesh.pending, [(3, 4), (0, 1)])
+            num.testing.assert_equal(mesh.ordered_frames(), frames[1:5])
+
+            # frames are written to the image at the cursor
+            if vertical:
+                num.testing.assert_equal(mesh.img_data[0], frames[4])
+            else:
+                num.testing.assert_equal(mesh.img_data[::-1, 0], frames[4])
+
+            # painting 1:1 blits the oldest frames first
+            img = qg.QImage(mesh.img.size(), qg.QImage.Format_RGB32)
+            painter = qg.QPainter(img)
+            mesh.draw(painter, None, None, rect=img.rect())
+            painter.end()
+            ctable = num.array(mesh.img.colorTable(), dtype=num.uint32)
+            ordered = mesh.ordered_frames()
+            expected = ordered if vertical else num.flipud(ordered.T)
+            for iy, ix in num.ndindex(*expected.shape):
+                self.assertEqual(img.pixel(ix, iy), ctable[expected[iy, ix]])
+
+            # replacing the image resets the ring
+            mesh.set_data(expected + 1)
+            self.assertEqual(mesh.iframe, 0)
+            self.assertEqual(mesh.pending, [(0, nframes)])
+            num.testing.assert_equal(mesh.frames, frames[1:5] + 1)
+
+            mesh.append_frames(frames)
+            num.testing.assert_equal(mesh.ordered_frames(), frames[-nframes:])
+
 
 if __name__ == "__main__":
     unittest.main()